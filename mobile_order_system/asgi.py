@@ -7,10 +7,44 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mobile_order_system.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# アプリケーション読み込み後にインポートする
+from orders.telegram_bot import update_queue  # noqa: E402
+from orders.table_index import warm_table_index  # noqa: E402
+
+
+async def lifespan(receive, send):
+    """
+    ASGI lifespanイベント処理
+
+    起動時にTelegram Botの処理ループとアプリケーションを立ち上げて
+    QRコード→テーブルインデックスを読み込み、終了時にBot APIとのHTTP接続を閉じる。
+    """
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            update_queue.startup()
+            await asyncio.to_thread(warm_table_index)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await asyncio.to_thread(update_queue.shutdown)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+# 調理ダッシュボードのSSE配信（/api/orders/dashboard/stream/）は長時間接続を
+# 保持するため、uvicorn/daphne等のASGIサーバーでこのアプリケーションを起動すること
+async def application(scope, receive, send):
+    # DjangoのASGIハンドラーはlifespanを扱わないため、ここで処理する
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    else:
+        await django_application(scope, receive, send)
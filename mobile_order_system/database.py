@@ -0,0 +1,67 @@
+"""
+環境変数からのデータベース設定
+
+DATABASE_URLが未設定の場合は単一店舗向けのSQLite（WAL・busy_timeout）を使い、
+postgresql://〜が設定された場合は永続接続・ヘルスチェック付きのPostgreSQLを使う。
+"""
+from pathlib import Path
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+POSTGRES_SCHEMES = ('postgres', 'postgresql', 'pgsql')
+
+# pgbouncer等のトランザクション単位でサーバー接続を切り替えるプーラー
+TRANSACTION_POOLERS = ('pgbouncer',)
+
+
+def sqlite_config(name, busy_timeout: float) -> dict:
+    """
+    SQLiteの設定
+
+    Args:
+        busy_timeout: ロック待ちの上限（秒）。書き込みが重なっても即座に
+            「database is locked」にせず、この時間まで待つ
+    """
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'OPTIONS': {'timeout': busy_timeout},
+    }
+
+
+def database_config(url: str, default_sqlite_path: Path, conn_max_age: int = 60,
+                    health_checks: bool = True, pooler: str = '',
+                    sqlite_busy_timeout: float = 5) -> dict:
+    """
+    DATABASE_URLからDATABASES['default']を組み立てる
+
+    Args:
+        conn_max_age: 接続を使い回す秒数（0でリクエストごとに切断、Noneで無期限）
+        health_checks: 使い回す接続をリクエスト開始時に確認する
+        pooler: 'pgbouncer'の場合はサーバーサイドカーソルを無効化する
+            （トランザクションプーリングではカーソルが別接続に渡るため）
+    """
+    if not url:
+        config = sqlite_config(default_sqlite_path, sqlite_busy_timeout)
+    else:
+        parts = urlsplit(url)
+        if parts.scheme == 'sqlite':
+            config = sqlite_config(unquote(parts.path[1:]) or default_sqlite_path, sqlite_busy_timeout)
+        elif parts.scheme in POSTGRES_SCHEMES:
+            config = {
+                'ENGINE': 'django.db.backends.postgresql',
+                'NAME': unquote(parts.path[1:]),
+                'USER': unquote(parts.username or ''),
+                'PASSWORD': unquote(parts.password or ''),
+                'HOST': parts.hostname or '',
+                'PORT': str(parts.port or ''),
+                # sslmode・connect_timeout等のクエリパラメータは接続オプションとして渡す
+                'OPTIONS': dict(parse_qsl(parts.query)),
+            }
+            if pooler in TRANSACTION_POOLERS:
+                config['DISABLE_SERVER_SIDE_CURSORS'] = True
+        else:
+            raise ValueError(f'未対応のDATABASE_URLです: {parts.scheme}')
+
+    config['CONN_MAX_AGE'] = conn_max_age
+    config['CONN_HEALTH_CHECKS'] = health_checks
+    return config
@@ -14,16 +14,21 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+from orders.views import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('orders.urls')),
 ]
 
-# 開発環境でメディアファイルを配信
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# メディアファイルを配信（メニュー画像はCache-Controlで無期限にキャッシュさせる）。
+# Webサーバー・CDNから配信する場合はSERVE_MEDIA=Falseにする
+if settings.SERVE_MEDIA:
+    urlpatterns += [
+        re_path(rf'^{re.escape(settings.MEDIA_URL.lstrip("/"))}(?P<path>.*)$', serve_media),
+    ]
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mobile_order_system.settings')
 
 application = get_wsgi_application()
+
+# アプリケーション読み込み後にQRコード→テーブルインデックスを読み込む
+from orders.table_index import warm_table_index  # noqa: E402
+
+warm_table_index()
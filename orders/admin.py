@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from .models import (
     Store, Table, Category, MenuItem, MenuItemImage,
-    Session, Order, OrderItem, StaffCall, Payment, User
+    Session, Order, OrderItem, StaffCall, Payment, Notification, User,
+    SalesHourly, SalesHourlyItem
 )
 
 
@@ -48,7 +49,10 @@ class SessionAdmin(admin.ModelAdmin):
     list_display = ['session_code', 'table', 'party_size', 'status', 'started_at', 'ended_at']
     list_filter = ['store', 'table', 'status', 'started_at']
     search_fields = ['session_code', 'telegram_chat_id']
-    readonly_fields = ['session_code', 'created_at', 'updated_at']
+    readonly_fields = [
+        'session_code', 'next_order_number', 'subtotal_amount', 'order_count', 'item_count',
+        'created_at', 'updated_at'
+    ]
 
 
 class OrderItemInline(admin.TabularInline):
@@ -90,6 +94,29 @@ class PaymentAdmin(admin.ModelAdmin):
     readonly_fields = ['total_amount', 'requested_at', 'created_at', 'updated_at']
 
 
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ['chat_id', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['chat_id', 'message']
+    readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(SalesHourly)
+class SalesHourlyAdmin(admin.ModelAdmin):
+    list_display = ['store', 'hour', 'revenue', 'payment_count', 'guest_count', 'order_count']
+    list_filter = ['store', 'hour']
+    readonly_fields = ['updated_at']
+
+
+@admin.register(SalesHourlyItem)
+class SalesHourlyItemAdmin(admin.ModelAdmin):
+    list_display = ['store', 'hour', 'menu_item_name', 'quantity', 'revenue', 'order_count']
+    list_filter = ['store', 'hour']
+    search_fields = ['menu_item_name']
+    readonly_fields = ['updated_at']
+
+
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
     list_display = ['username', 'email', 'store', 'role', 'is_active', 'is_staff']
@@ -0,0 +1,194 @@
+"""
+注文フローのベンチマーク
+
+QRスキャン→セッション作成、メニュー一覧、注文作成、調理ダッシュボードのポーリング、
+会計依頼の各APIをテストクライアントで繰り返し呼び出し、レイテンシ（p50/p95）と
+クエリ数を計測する。結果はリリース間で比較できるようJSONに変換できる辞書で返す。
+"""
+import time
+import uuid
+
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import MenuItem, Order, OrderItem, Session, Store, Table, User
+
+SCENARIOS = ['session_create', 'menu_list', 'order_create', 'dashboard_poll', 'payment_request']
+
+
+class BenchmarkError(Exception):
+    """計測対象のAPIが想定外のレスポンスを返した"""
+
+
+def percentile(values, pct: float) -> float:
+    """最近順位法によるパーセンタイル"""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(durations, query_counts) -> dict:
+    """計測値の要約（時間はミリ秒）"""
+    return {
+        'iterations': len(durations),
+        'p50_ms': round(percentile(durations, 50), 3),
+        'p95_ms': round(percentile(durations, 95), 3),
+        'mean_ms': round(sum(durations) / len(durations), 3),
+        'min_ms': round(min(durations), 3),
+        'max_ms': round(max(durations), 3),
+        'queries_p50': percentile(query_counts, 50),
+        'queries_max': max(query_counts),
+    }
+
+
+def measure(prepare, iterations: int, warmup: int = 1) -> dict:
+    """
+    prepare()が返す呼び出しを計測
+
+    準備（空きテーブルの確保など）は計測に含めないよう、prepareで行ってから
+    計測する呼び出しを返す。
+    """
+    for _ in range(warmup):
+        prepare()()
+    durations, query_counts = [], []
+    for _ in range(iterations):
+        call = prepare()
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            call()
+            durations.append((time.perf_counter() - started) * 1000)
+        query_counts.append(len(ctx.captured_queries))
+    return summarize(durations, query_counts)
+
+
+def default_store():
+    """メニュー項目が最も多い店舗"""
+    return Store.objects.filter(is_active=True).annotate(
+        menu_count=Count('menuitem')
+    ).order_by('-menu_count', 'id').first()
+
+
+class OrderFlowBenchmark:
+    """1店舗の注文フローの計測"""
+
+    def __init__(self, store, lines: int = 3):
+        self.store = store
+        self.client = APIClient()
+        self.staff_client = APIClient()
+        staff = User.objects.filter(store=store).first() or User.objects.create_user(
+            username=f'bench-{store.id}', password=uuid.uuid4().hex, store=store, role='chef'
+        )
+        self.staff_client.force_authenticate(user=staff)
+
+        self.tables = list(Table.objects.filter(store=store, is_available=True).order_by('id'))
+        menu_items = MenuItem.objects.filter(
+            store=store, is_active=True, is_available=True
+        ).order_by('id')
+        self.order_lines = [
+            {'menu_item_id': item.id, 'quantity': 1}
+            for item in menu_items[:lines]
+        ]
+        if not self.tables or len(self.order_lines) < lines:
+            raise BenchmarkError(f'{store.name}のテーブルまたはメニュー項目が不足しています')
+        self._table_position = 0
+        self._order_session = None
+        self._dashboard_cursor = None
+
+    def _expect(self, response, expected_status: int):
+        if response.status_code != expected_status:
+            raise BenchmarkError(
+                f'{response.request["PATH_INFO"]}: {response.status_code} {getattr(response, "data", "")}'
+            )
+        return response
+
+    def _free_table(self):
+        """来店中のセッションを終了させたテーブルを順に返す"""
+        table = self.tables[self._table_position % len(self.tables)]
+        self._table_position += 1
+        Session.objects.filter(table=table, status__in=Session.ACTIVE_STATUSES).update(
+            status='completed', ended_at=timezone.now()
+        )
+        return table
+
+    def _session_with_order(self):
+        """注文済みの来店中セッションを作成"""
+        table = self._free_table()
+        session = Session.objects.create(
+            store=self.store, table=table, session_code=f'BENCH-{uuid.uuid4().hex[:12].upper()}',
+            party_size=2, status='active', started_at=timezone.now()
+        )
+        menu_item = MenuItem.objects.get(pk=self.order_lines[0]['menu_item_id'])
+        order = Order.objects.create(
+            session=session, order_number=session.allocate_order_number(),
+            total_amount=menu_item.price, status='pending', ordered_at=timezone.now()
+        )
+        OrderItem.objects.create(
+            order=order, menu_item=menu_item, menu_item_name=menu_item.name,
+            unit_price=menu_item.price, quantity=1, subtotal=menu_item.price
+        )
+        session.add_to_totals(order.total_amount, 1, 1)
+        return session
+
+    def prepare_session_create(self):
+        table = self._free_table()
+        return lambda: self._expect(
+            self.client.post('/api/sessions/', {'qr_code_url': table.qr_code_url, 'party_size': 2}),
+            201
+        )
+
+    def prepare_menu_list(self):
+        return lambda: self._expect(
+            self.client.get('/api/menu-items/', {'store_id': self.store.id}), 200
+        )
+
+    def prepare_order_create(self):
+        if self._order_session is None:
+            self._order_session = self._session_with_order()
+        payload = {'session_code': self._order_session.session_code, 'items': self.order_lines}
+        return lambda: self._expect(self.client.post('/api/orders/', payload, format='json'), 201)
+
+    def prepare_dashboard_poll(self):
+        if self._dashboard_cursor is None:
+            response = self._expect(
+                self.staff_client.get('/api/orders/dashboard/', {'store_id': self.store.id}), 200
+            )
+            self._dashboard_cursor = response.data['cursor']
+
+        def poll():
+            # 前回のカーソル以降の差分取得（ダッシュボードの定常的なポーリング）
+            params = {'store_id': self.store.id}
+            if self._dashboard_cursor:
+                params['since'] = self._dashboard_cursor
+            response = self._expect(self.staff_client.get('/api/orders/dashboard/', params), 200)
+            self._dashboard_cursor = response.data['cursor']
+        return poll
+
+    def prepare_payment_request(self):
+        session = self._session_with_order()
+        return lambda: self._expect(
+            self.client.post('/api/payments/', {'session_code': session.session_code}), 201
+        )
+
+
+def run_benchmarks(store=None, scenarios=None, iterations: int = 50, warmup: int = 3,
+                   lines: int = 3) -> dict:
+    """
+    注文フローのベンチマークを実行
+
+    Args:
+        store: 対象店舗（省略時はメニュー項目が最も多い店舗）
+        lines: 注文作成1回あたりの明細数
+    Returns:
+        シナリオ名をキーとする計測結果
+    """
+    store = store or default_store()
+    if store is None:
+        raise BenchmarkError('店舗がありません。create_test_dataでデータを作成してください')
+    benchmark = OrderFlowBenchmark(store, lines=lines)
+    return {
+        name: measure(getattr(benchmark, f'prepare_{name}'), iterations, warmup)
+        for name in (scenarios or SCENARIOS)
+    }
@@ -0,0 +1,148 @@
+"""
+キャッシュ関連のヘルパー
+
+メニューは店舗ごとの「メニューバージョン」をキーに含めてキャッシュする。
+メニューが更新されるとバージョンを進めるだけで古いキャッシュは参照されなくなる。
+
+キャッシュがプロセスごと（LocMemCache）の場合は他のワーカーでのバージョン更新が
+伝わらないため、バージョンとメニューのキャッシュをMENU_CACHE_LOCAL_TIMEOUT秒で
+失効させ、その間隔で他のワーカーの更新を反映する。
+"""
+import hashlib
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils.http import parse_etags, quote_etag
+
+# store_idを指定しない一覧（全店舗）用のバージョンキー
+ALL_STORES = 'all'
+
+MENU_CACHE_TIMEOUT = getattr(settings, 'MENU_CACHE_TIMEOUT', 60 * 60)
+MENU_CACHE_LOCAL_TIMEOUT = getattr(settings, 'MENU_CACHE_LOCAL_TIMEOUT', 30)
+
+
+def is_cache_shared() -> bool:
+    """キャッシュがワーカープロセス間で共有されているか"""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def menu_cache_timeout() -> int:
+    """メニューのキャッシュの有効期限（秒）"""
+    if is_cache_shared():
+        return MENU_CACHE_TIMEOUT
+    return min(MENU_CACHE_TIMEOUT, MENU_CACHE_LOCAL_TIMEOUT)
+
+
+def _version_timeout():
+    return None if is_cache_shared() else MENU_CACHE_LOCAL_TIMEOUT
+
+
+def _menu_version_key(store_id) -> str:
+    # ?store_id=01等の表記の違いで、更新時に進めるキーと別のキーにならないよう正規化する
+    try:
+        store_id = int(store_id)
+    except (TypeError, ValueError):
+        pass
+    return f'menu_version:{store_id}'
+
+
+def get_menu_version(store_id) -> int:
+    """店舗のメニューバージョンを取得"""
+    key = _menu_version_key(store_id)
+    version = cache.get(key)
+    if version is None:
+        # キーが失われても過去のバージョンと衝突しないよう時刻を初期値にする
+        cache.add(key, time.time_ns(), timeout=_version_timeout())
+        version = cache.get(key)
+    return version
+
+
+def _bump(store_id):
+    for key in (_menu_version_key(store_id), _menu_version_key(ALL_STORES)):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=_version_timeout())
+
+
+def bump_menu_version(store_id):
+    """
+    店舗のメニューバージョンを進める
+
+    コミット前に他のリクエストが古いデータを新バージョンでキャッシュしないよう、
+    コミット後にもう一度進める。
+    """
+    _bump(store_id)
+    transaction.on_commit(partial(_bump, store_id))
+
+
+def _request_digest(request) -> str:
+    # ページネーションのリンクはホスト名を含むためキーに加える
+    params = sorted(request.query_params.lists())
+    return hashlib.md5(f'{request.get_host()}?{params}'.encode()).hexdigest()
+
+
+def menu_list_cache_key(request, prefix='menu_list') -> str:
+    """メニュー（カテゴリ）一覧レスポンスのキャッシュキー"""
+    store_id = request.query_params.get('store_id') or ALL_STORES
+    version = get_menu_version(store_id)
+    return f'{prefix}:{store_id}:{version}:{_request_digest(request)}'
+
+
+def store_menu_cache_key(store_id, prefix: str) -> str:
+    """店舗単位のメニューデータのキャッシュキー（リクエストパラメータに依存しないもの）"""
+    return f'{prefix}:{store_id}:{get_menu_version(store_id)}'
+
+
+def make_etag(request, *stamp) -> str:
+    """バージョンスタンプとリクエストパラメータから強いETagを生成"""
+    value = ':'.join(str(part) for part in stamp)
+    digest = hashlib.md5(f'{value}:{_request_digest(request)}'.encode()).hexdigest()
+    return quote_etag(digest)
+
+
+def etag_matches(request, etag: str) -> bool:
+    """
+    If-None-Matchヘッダーが現在のETagと一致するか
+
+    圧縮ミドルウェアが弱いETag（W/"..."）に変換するため、弱い比較で判定する。
+    """
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    etags = [value.removeprefix('W/') for value in parse_etags(header)]
+    return '*' in etags or etag in etags
+
+
+TABLE_INDEX_VERSION_KEY = 'table_index_version'
+
+
+def get_table_index_version() -> int:
+    """QRコード→テーブルインデックスのバージョンを取得"""
+    version = cache.get(TABLE_INDEX_VERSION_KEY)
+    if version is None:
+        cache.add(TABLE_INDEX_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(TABLE_INDEX_VERSION_KEY)
+    return version
+
+
+def _bump_table_index():
+    try:
+        cache.incr(TABLE_INDEX_VERSION_KEY)
+    except ValueError:
+        cache.set(TABLE_INDEX_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def bump_table_index_version():
+    """
+    QRコード→テーブルインデックスのバージョンを進める
+
+    各プロセスは次回の参照時にバージョンの変化を検知してインデックスを破棄する。
+    """
+    _bump_table_index()
+    transaction.on_commit(_bump_table_index)
@@ -0,0 +1,69 @@
+"""
+レスポンスの圧縮
+
+GZipMiddlewareを拡張し、brotliパッケージがインストールされていてクライアントが
+対応している場合はBrotliで圧縮する。SSE（text/event-stream）はイベントを即時に
+届けるため、画像は圧縮済みのため対象外とする。
+
+gzipはGZipMiddlewareと同様にランダム長のヘッダーでBREACH攻撃を緩和するが、Brotliには
+同じ手段がないため、秘密情報（セッションコード等）を含まないとビューが明示した
+レスポンス（allow_brotli）のみBrotliで圧縮する。
+"""
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+re_accepts_brotli = _lazy_re_compile(r'\bbr\b')
+
+# 圧縮しないContent-Type（前方一致）
+UNCOMPRESSED_CONTENT_TYPES = ('text/event-stream', 'image/')
+
+# リクエストごとに圧縮するため、圧縮率より速度を優先した品質
+BROTLI_QUALITY = 5
+
+# これより短いレスポンスは圧縮しない（GZipMiddlewareと同じ）
+MIN_COMPRESS_LENGTH = 200
+
+
+def allow_brotli(response):
+    """秘密情報を含まない（Brotliで圧縮してよい）レスポンスとして印を付ける"""
+    response.allow_brotli = True
+    return response
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """Brotli（利用可能な場合）またはgzipによるレスポンス圧縮ミドルウェア"""
+
+    def process_response(self, request, response):
+        if response.get('Content-Type', '').startswith(UNCOMPRESSED_CONTENT_TYPES):
+            return response
+        if (
+            brotli is not None
+            and getattr(response, 'allow_brotli', False)
+            and not response.streaming
+            and len(response.content) >= MIN_COMPRESS_LENGTH
+            and not response.has_header('Content-Encoding')
+            and re_accepts_brotli.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        ):
+            return self._compress_brotli(response)
+        return super().process_response(request, response)
+
+    @staticmethod
+    def _compress_brotli(response):
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        # 圧縮後の表現は元と同一バイト列ではないため、GZipMiddlewareと同様に弱いETagにする
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
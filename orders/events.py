@@ -0,0 +1,78 @@
+"""
+キッチンダッシュボード向けの注文イベント配信
+
+注文作成・ステータス更新のイベントを店舗ごとの購読者（SSE接続）へ配信する。
+購読者はASGIのイベントループ上で待機し、発行側は同期ビューのスレッドから
+呼び出されるため、キューへの投入はイベントループ経由で行う。
+配信はプロセス内で完結するため、複数プロセス構成では各プロセスの接続にのみ届く。
+"""
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from functools import partial
+
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# 購読者ごとのキュー上限。溢れた場合はスナップショットを再送させる
+SUBSCRIBER_QUEUE_SIZE = 256
+
+RESYNC = 'resync'
+
+
+class DashboardEventBroker:
+    """店舗単位の注文イベント配信"""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, store_id) -> asyncio.Queue:
+        """イベントループ内から購読を開始"""
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers[str(store_id)].add(subscriber)
+        return queue
+
+    def unsubscribe(self, store_id, queue: asyncio.Queue):
+        """購読を終了"""
+        with self._lock:
+            subscribers = self._subscribers[str(store_id)]
+            subscribers.difference_update({s for s in subscribers if s[1] is queue})
+            if not subscribers:
+                del self._subscribers[str(store_id)]
+
+    def publish(self, store_id, event_type: str, data):
+        """店舗の全購読者へイベントを送信（任意のスレッドから呼び出し可能）"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(str(store_id), ()))
+
+        event = {'type': event_type, 'data': data}
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, event)
+            except RuntimeError:
+                # 購読側のイベントループが既に終了している
+                logger.debug("終了済みの購読者をスキップ")
+
+    @staticmethod
+    def _put(queue: asyncio.Queue, event: dict):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # 取りこぼした差分は適用できないため、溜まった分を破棄して再同期させる
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({'type': RESYNC, 'data': None})
+
+
+# グローバルインスタンス
+dashboard_events = DashboardEventBroker()
+
+
+def publish_order_event(store_id, event_type: str, data):
+    """トランザクション確定後にダッシュボードへイベントを送信"""
+    transaction.on_commit(partial(dashboard_events.publish, store_id, event_type, data))
@@ -0,0 +1,155 @@
+"""
+注文・注文明細・会計のCSV/NDJSONエクスポート
+
+モデルインスタンスやシリアライザを介さずvalues_listの行をそのまま書き出し、
+iterator(chunk_size)でDBから少しずつ読み込むため、件数に関わらずメモリ使用量は一定。
+"""
+import csv
+import datetime
+import json
+from decimal import Decimal
+from itertools import islice
+
+from django.utils import timezone
+
+from .models import Order, OrderItem, Payment
+from .reports import local_date_range
+
+# DBから一度に読み込む行数
+EXPORT_CHUNK_SIZE = 2000
+
+# 1回の書き出しにまとめる行数
+EXPORT_LINES_PER_WRITE = 500
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+# 種類ごとの (モデル, 店舗の参照, 日付で絞り込む列, [(列名, 参照)])
+EXPORTS = {
+    'orders': (Order, 'session__store_id', 'ordered_at', [
+        ('id', 'id'),
+        ('store_id', 'session__store_id'),
+        ('table_number', 'session__table__table_number'),
+        ('session_code', 'session__session_code'),
+        ('order_number', 'order_number'),
+        ('telegram_username', 'telegram_username'),
+        ('status', 'status'),
+        ('total_amount', 'total_amount'),
+        ('ordered_at', 'ordered_at'),
+        ('served_at', 'served_at'),
+        ('cancelled_at', 'cancelled_at'),
+    ]),
+    'order-items': (OrderItem, 'order__session__store_id', 'order__ordered_at', [
+        ('id', 'id'),
+        ('order_id', 'order_id'),
+        ('store_id', 'order__session__store_id'),
+        ('session_code', 'order__session__session_code'),
+        ('order_number', 'order__order_number'),
+        ('menu_item_id', 'menu_item_id'),
+        ('menu_item_name', 'menu_item_name'),
+        ('unit_price', 'unit_price'),
+        ('quantity', 'quantity'),
+        ('subtotal', 'subtotal'),
+        ('status', 'status'),
+        ('ordered_at', 'order__ordered_at'),
+    ]),
+    'payments': (Payment, 'session__store_id', 'requested_at', [
+        ('id', 'id'),
+        ('store_id', 'session__store_id'),
+        ('table_number', 'session__table__table_number'),
+        ('session_code', 'session__session_code'),
+        ('party_size', 'session__party_size'),
+        ('total_amount', 'total_amount'),
+        ('payment_method', 'payment_method'),
+        ('status', 'status'),
+        ('requested_at', 'requested_at'),
+        ('paid_at', 'paid_at'),
+    ]),
+}
+
+
+def export_rows(kind: str, store_id=None, date_from=None, date_to=None,
+                chunk_size: int = EXPORT_CHUNK_SIZE):
+    """
+    エクスポート対象の列名と行のイテレータを返す
+
+    Args:
+        kind: 'orders'・'order-items'・'payments'
+        date_from, date_to: 現地時刻の日付（両端を含む）
+    """
+    model, store_lookup, date_lookup, columns = EXPORTS[kind]
+    queryset = model.objects.all()
+    if store_id:
+        queryset = queryset.filter(**{store_lookup: store_id})
+    if date_from:
+        start, _ = local_date_range(date_from, date_from)
+        queryset = queryset.filter(**{f'{date_lookup}__gte': start})
+    if date_to:
+        _, end = local_date_range(date_to, date_to)
+        queryset = queryset.filter(**{f'{date_lookup}__lt': end})
+    rows = queryset.order_by('id').values_list(
+        *(lookup for _, lookup in columns)
+    ).iterator(chunk_size=chunk_size)
+    return [name for name, _ in columns], rows
+
+
+def _format_value(value):
+    if isinstance(value, datetime.datetime):
+        return timezone.localtime(value).isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+# 表計算ソフトが数式として解釈する先頭文字
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _format_csv_value(value):
+    # 利用者の入力（メモ・ユーザー名等）が数式として実行されないよう先頭に'を付ける
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return _format_value(value)
+
+
+class _Echo:
+    """csv.writerの書き込み先（書き込んだ行をそのまま返す）"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(columns, rows):
+    """CSVの行を順に生成（Excelで文字化けしないよう先頭にBOMを付ける）"""
+    writer = csv.writer(_Echo())
+    yield '\ufeff' + writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([_format_csv_value(value) for value in row])
+
+
+def iter_ndjson(columns, rows):
+    """NDJSON（1行1オブジェクト）の行を順に生成"""
+    for row in rows:
+        record = {name: _format_value(value) for name, value in zip(columns, row)}
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def iter_export(kind: str, export_format: str, **filters):
+    """書き出す行のイテレータ"""
+    columns, rows = export_rows(kind, **filters)
+    if export_format == 'csv':
+        return iter_csv(columns, rows)
+    return iter_ndjson(columns, rows)
+
+
+def next_batch(lines, size: int = EXPORT_LINES_PER_WRITE) -> str:
+    """最大size行を連結して返す（終端では空文字列）"""
+    return ''.join(islice(lines, size))
+
+
+def iter_batches(lines, size: int = EXPORT_LINES_PER_WRITE):
+    """行をsize行ずつまとめて生成"""
+    while batch := next_batch(lines, size):
+        yield batch
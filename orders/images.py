@@ -0,0 +1,256 @@
+"""
+メニュー画像の派生画像生成
+
+アップロードされた元画像からPillowでサムネイル・大サイズの画像を生成する。
+各サイズはWebPと、WebP非対応端末向けのJPEGの2形式で保存し、寸法・サイズ・
+MIMEタイプをMenuItemImageに記録する。生成はリクエストを待たせないよう
+バックグラウンドのワーカープールで行う。
+
+画像はmenu/<内容のSHA-256>.<拡張子>に保存する。内容が変わればURLも変わるため
+ブラウザに無期限にキャッシュさせることができ、同じ写真を使うメニュー項目間では
+ファイルを共有する。
+"""
+import hashlib
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import MenuItem, MenuItemImage
+
+logger = logging.getLogger(__name__)
+
+# 派生画像のサイズ（幅, 高さ）。サムネイルは正方形に切り抜き、大サイズは縦横比を保って縮小
+IMAGE_VARIANTS = {
+    'thumbnail': (320, 320),
+    'large': (1280, 1280),
+}
+
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+# アップロードを受け付ける形式
+UPLOAD_FORMATS = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'WEBP': 'image/webp'}
+UPLOAD_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+
+
+class InvalidImageError(Exception):
+    """画像として読み込めない、または対応していない形式"""
+
+
+# 内容のハッシュをファイル名とする画像のパス
+CONTENT_PATH_PATTERN = re.compile(r'^menu/[0-9a-f]{64}\.(?:jpg|png|webp)$')
+
+
+def content_path(data: bytes, ext: str) -> str:
+    """画像の保存先（MEDIA_ROOTからの相対パス）"""
+    return f'menu/{hashlib.sha256(data).hexdigest()}.{ext}'
+
+
+def is_content_addressed(path: str) -> bool:
+    """内容が変わらない（無期限にキャッシュできる）パスか"""
+    return bool(CONTENT_PATH_PATTERN.match(path))
+
+
+def media_url(path):
+    """保存先パスを配信URLに変換（URLが設定済みの場合はそのまま返す）"""
+    if not path:
+        return None
+    if path.startswith(('http://', 'https://', '/')):
+        return path
+    return default_storage.url(path)
+
+
+def inspect_image(data: bytes):
+    """
+    アップロード画像を検証して(形式, 幅, 高さ)を返す
+
+    Raises:
+        InvalidImageError: 画像でない・対応外の形式・画素数が多すぎる場合
+    """
+    try:
+        with Image.open(BytesIO(data)) as img:
+            img.verify()
+            image_format, size = img.format, img.size
+    except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise InvalidImageError(f'画像を読み込めません: {e}')
+    if image_format not in UPLOAD_FORMATS:
+        raise InvalidImageError(f'対応していない画像形式です: {image_format}')
+    return image_format, size[0], size[1]
+
+
+def _encode(img: Image.Image, image_format: str, **options) -> bytes:
+    buffer = BytesIO()
+    img.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def render_variants(data: bytes) -> dict:
+    """
+    元画像から派生画像を生成（ワーカープロセスでも実行できるようDBを参照しない）
+
+    Returns:
+        {サイズ名: {'width', 'height', 'webp': bytes, 'jpeg': bytes}}
+    """
+    with Image.open(BytesIO(data)) as source:
+        # スマートフォンの写真は回転情報をEXIFに持つため、画素に反映してから縮小する
+        img = ImageOps.exif_transpose(source)
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img = img.convert('RGBA')
+            background = Image.new('RGB', img.size, 'white')
+            background.paste(img, mask=img.getchannel('A'))
+            img = background
+        else:
+            img = img.convert('RGB')
+
+    rendered = {}
+    for variant, size in IMAGE_VARIANTS.items():
+        if variant == 'thumbnail':
+            resized = ImageOps.fit(img, size, Image.LANCZOS)
+        else:
+            resized = img.copy()
+            resized.thumbnail(size, Image.LANCZOS)
+        rendered[variant] = {
+            'width': resized.width,
+            'height': resized.height,
+            'webp': _encode(resized, 'WEBP', quality=WEBP_QUALITY, method=4),
+            'jpeg': _encode(resized, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True),
+        }
+    return rendered
+
+
+def store_content(data: bytes, ext: str) -> str:
+    """
+    画像を内容のハッシュのパスに保存（同じ内容のファイルがあれば書き込まない）
+
+    他のメニュー項目と共有している可能性があるため、差し替え前のファイルは削除しない。
+    """
+    path = content_path(data, ext)
+    if not default_storage.exists(path):
+        saved = default_storage.save(path, ContentFile(data))
+        if saved != path:
+            # 同時に同じ内容が保存され、別名で保存された
+            default_storage.delete(saved)
+    return path
+
+
+def save_original(menu_item: MenuItem, data: bytes) -> MenuItemImage:
+    """アップロードされた元画像を保存してMenuItemImage（original）に記録"""
+    image_format, width, height = inspect_image(data)
+    path = store_content(data, UPLOAD_EXTENSIONS[image_format])
+    image, _ = MenuItemImage.objects.update_or_create(
+        menu_item=menu_item,
+        image_type='original',
+        defaults={
+            'file_path': path,
+            'fallback_path': '',
+            'file_size': len(data),
+            'width': width,
+            'height': height,
+            'mime_type': UPLOAD_FORMATS[image_format],
+            'uploaded_at': timezone.now(),
+        }
+    )
+    return image
+
+
+@transaction.atomic
+def store_variants(menu_item: MenuItem, rendered: dict, original_path: str = None) -> bool:
+    """
+    生成した派生画像を保存し、MenuItemImageとメニュー項目の画像パスを更新
+
+    Args:
+        original_path: 生成元の画像パス。生成中に新しい画像がアップロードされていれば保存しない
+    Returns:
+        元画像が差し替えられていて保存しなかった場合はFalse
+    """
+    if original_path is not None and not MenuItemImage.objects.select_for_update().filter(
+        menu_item=menu_item, image_type='original', file_path=original_path
+    ).exists():
+        return False
+    now = timezone.now()
+    paths = {}
+    for variant, result in rendered.items():
+        webp_path = store_content(result['webp'], 'webp')
+        jpeg_path = store_content(result['jpeg'], 'jpg')
+        MenuItemImage.objects.update_or_create(
+            menu_item=menu_item,
+            image_type=variant,
+            defaults={
+                'file_path': webp_path,
+                'fallback_path': jpeg_path,
+                'file_size': len(result['webp']),
+                'width': result['width'],
+                'height': result['height'],
+                'mime_type': 'image/webp',
+                'uploaded_at': now,
+            }
+        )
+        paths[variant] = webp_path
+
+    menu_item.image_path = paths['large']
+    menu_item.image_thumbnail_path = paths['thumbnail']
+    # post_saveシグナルでメニューキャッシュも無効化される
+    menu_item.save(update_fields=['image_path', 'image_thumbnail_path', 'updated_at'])
+    return True
+
+
+def process_menu_item_image(menu_item_id: int, original_path: str = None) -> bool:
+    """
+    メニュー項目の元画像から派生画像を生成
+
+    Args:
+        original_path: アップロード時の元画像のパス。その後に別の画像がアップロードされていれば
+            古い画像で上書きしないよう生成しない
+    Returns:
+        元画像がない・差し替えられた場合はFalse
+    """
+    original = MenuItemImage.objects.select_related('menu_item').filter(
+        menu_item_id=menu_item_id, image_type='original'
+    ).first()
+    if original is None or (original_path is not None and original.file_path != original_path):
+        return False
+    with default_storage.open(original.file_path, 'rb') as f:
+        data = f.read()
+    return store_variants(original.menu_item, render_variants(data), original.file_path)
+
+
+# 派生画像生成のワーカープール（IMAGE_WORKERSが0の場合はコミット時に同期で生成）
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS, thread_name_prefix='menu-image'
+            )
+        return _executor
+
+
+def _run_job(menu_item_id: int, original_path: str):
+    close_old_connections()
+    try:
+        process_menu_item_image(menu_item_id, original_path)
+    except Exception:
+        logger.exception(f"メニュー画像の生成に失敗しました: menu_item_id={menu_item_id}")
+    finally:
+        close_old_connections()
+
+
+def schedule_image_processing(menu_item_id: int, original_path: str = None):
+    """トランザクションのコミット後に派生画像の生成を依頼"""
+    if getattr(settings, 'IMAGE_WORKERS', 2) <= 0:
+        transaction.on_commit(lambda: process_menu_item_image(menu_item_id, original_path))
+    else:
+        transaction.on_commit(lambda: _get_executor().submit(_run_job, menu_item_id, original_path))
@@ -1,15 +1,46 @@
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from decimal import Decimal
 from orders.models import (
     Store, Table, Category, MenuItem,
-    Session, Order, OrderItem, User
+    Session, Order, OrderItem, Payment, User
 )
+from orders.qr_tokens import build_qr_code_url
+
+# 大量データ生成時のカテゴリ
+SCALED_CATEGORIES = ['前菜', 'メイン', '飲み物', 'デザート']
 
 
 class Command(BaseCommand):
     help = 'テストデータを作成'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stores',
+            type=int,
+            default=1,
+            help='店舗数（2以上でサンプル店舗に加えて大量データの店舗を生成）'
+        )
+        parser.add_argument(
+            '--tables',
+            type=int,
+            default=20,
+            help='生成する店舗あたりのテーブル数'
+        )
+        parser.add_argument(
+            '--menu-items',
+            type=int,
+            default=50,
+            help='生成する店舗あたりのメニュー項目数'
+        )
+        parser.add_argument(
+            '--history',
+            type=int,
+            default=0,
+            help='生成する店舗あたりの会計済みセッション数（過去の注文履歴）'
+        )
+
     def handle(self, *args, **options):
         self.stdout.write('テストデータを作成しています...')
         
@@ -215,6 +246,7 @@ class Command(BaseCommand):
             session_code=f'TBL1-{timezone.now().strftime("%Y%m%d")}-ABC123',
             party_size=4,
             status='active',
+            next_order_number=3,
             started_at=timezone.now() - timezone.timedelta(minutes=30)
         )
         
@@ -291,6 +323,7 @@ class Command(BaseCommand):
             session_code=f'TBL4-{timezone.now().strftime("%Y%m%d")}-DEF456',
             party_size=2,
             status='active',
+            next_order_number=2,
             started_at=timezone.now() - timezone.timedelta(minutes=15)
         )
         
@@ -315,9 +348,21 @@ class Command(BaseCommand):
             status='pending'
         )
         
+        if options['stores'] > 1:
+            self.stdout.write('大量データの店舗を作成中...')
+            for number in range(2, options['stores'] + 1):
+                self._create_scaled_store(
+                    number, options['tables'], options['menu_items'], options['history']
+                )
+
+        # セッションの注文集計列を反映
+        call_command('reconcile_session_totals', fix=True, stdout=self.stdout)
+        # 提供済みの注文を売上集計に反映
+        call_command('rebuild_sales_rollups', stdout=self.stdout)
+        
         self.stdout.write(self.style.SUCCESS('テストデータの作成が完了しました！'))
         self.stdout.write('')
-        self.stdout.write(f'店舗: {store.name}')
+        self.stdout.write(f'店舗: {store.name}（全{Store.objects.count()}店舗）')
         self.stdout.write(f'テーブル: {len(tables)}個')
         self.stdout.write(f'カテゴリ: {len(categories)}個')
         self.stdout.write(f'メニュー項目: {len(menu_items)}個')
@@ -328,3 +373,91 @@ class Command(BaseCommand):
         self.stdout.write('  管理者 - username: admin, password: admin123')
         self.stdout.write('  料理人 - username: chef1, password: chef123')
         self.stdout.write('  スーパーバイザ - username: supervisor1, password: super123')
+
+    def _create_scaled_store(self, number, table_count, item_count, history):
+        """ベンチマーク用の店舗をbulk_createで生成"""
+        store = Store.objects.create(name=f'ベンチマーク店舗{number}', is_active=True)
+
+        tables = Table.objects.bulk_create([
+            Table(store=store, table_number=f'T-{index}', qr_code_url=f'pending-{store.id}-{index}', capacity=4)
+            for index in range(1, table_count + 1)
+        ])
+        for table in tables:
+            table.qr_code_url = build_qr_code_url(table.id, store.id, store.qr_epoch)
+        Table.objects.bulk_update(tables, ['qr_code_url'], batch_size=500)
+
+        categories = Category.objects.bulk_create([
+            Category(store=store, name=name, display_order=index)
+            for index, name in enumerate(SCALED_CATEGORIES, 1)
+        ])
+        menu_items = MenuItem.objects.bulk_create([
+            MenuItem(
+                store=store,
+                category=categories[index % len(categories)],
+                name=f'メニュー{index}',
+                description=f'ベンチマーク用メニュー{index}',
+                price=Decimal(300 + (index % 20) * 50),
+                display_order=index,
+                is_available=True
+            )
+            for index in range(1, item_count + 1)
+        ], batch_size=500)
+
+        if not history or not tables or not menu_items:
+            return
+
+        now = timezone.now()
+        sessions = Session.objects.bulk_create([
+            Session(
+                store=store,
+                table=tables[index % len(tables)],
+                session_code=f'HIST{store.id}-{index}',
+                party_size=2,
+                status='completed',
+                next_order_number=3,
+                started_at=now - timezone.timedelta(hours=index + 2),
+                ended_at=now - timezone.timedelta(hours=index + 1)
+            )
+            for index in range(history)
+        ], batch_size=500)
+        orders = Order.objects.bulk_create([
+            Order(
+                session=session,
+                order_number=order_number,
+                total_amount=Decimal('0.00'),
+                status='served',
+                ordered_at=session.started_at + timezone.timedelta(minutes=order_number * 10),
+                served_at=session.started_at + timezone.timedelta(minutes=order_number * 10 + 5)
+            )
+            for session in sessions
+            for order_number in (1, 2)
+        ], batch_size=500)
+
+        items = []
+        for index, order in enumerate(orders):
+            for offset in range(3):
+                menu_item = menu_items[(index + offset) % len(menu_items)]
+                items.append(OrderItem(
+                    order=order,
+                    menu_item=menu_item,
+                    menu_item_name=menu_item.name,
+                    unit_price=menu_item.price,
+                    quantity=1,
+                    subtotal=menu_item.price,
+                    status='served'
+                ))
+                order.total_amount += menu_item.price
+        OrderItem.objects.bulk_create(items, batch_size=500)
+        Order.objects.bulk_update(orders, ['total_amount'], batch_size=500)
+
+        Payment.objects.bulk_create([
+            Payment(
+                session=session,
+                total_amount=orders[index * 2].total_amount + orders[index * 2 + 1].total_amount,
+                payment_method='cash',
+                status='paid',
+                requested_at=session.ended_at,
+                paid_at=session.ended_at
+            )
+            for index, session in enumerate(sessions)
+        ], batch_size=500)
@@ -13,7 +13,7 @@ class Command(BaseCommand):
         self.stdout.write('Telegram Webhook削除中...')
         
         try:
-            asyncio.run(telegram_bot.delete_webhook())
+            asyncio.run(self._delete_webhook())
             self.stdout.write(
                 self.style.SUCCESS('✅ Webhook削除完了')
             )
@@ -21,3 +21,10 @@ class Command(BaseCommand):
             self.stdout.write(
                 self.style.ERROR(f'❌ エラー: {e}')
             )
+    
+    async def _delete_webhook(self):
+        try:
+            await telegram_bot.delete_webhook()
+        finally:
+            # 接続プールを閉じてからイベントループを終了する
+            await telegram_bot.shutdown()
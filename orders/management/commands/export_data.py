@@ -0,0 +1,67 @@
+"""
+注文・注文明細・会計のエクスポート管理コマンド
+"""
+from django.core.management.base import BaseCommand
+import datetime
+from orders.exports import EXPORTS, EXPORT_FORMATS, EXPORT_CHUNK_SIZE, iter_export, iter_batches
+
+
+class Command(BaseCommand):
+    help = '注文・注文明細・会計をCSVまたはNDJSONで書き出します'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'kind',
+            choices=list(EXPORTS),
+            help='エクスポートする種類'
+        )
+        parser.add_argument(
+            '--format',
+            dest='export_format',
+            choices=list(EXPORT_FORMATS),
+            default='csv',
+            help='出力形式'
+        )
+        parser.add_argument(
+            '--store-id',
+            type=int,
+            help='特定の店舗のみ出力'
+        )
+        parser.add_argument(
+            '--date-from',
+            type=datetime.date.fromisoformat,
+            help='開始日（YYYY-MM-DD）'
+        )
+        parser.add_argument(
+            '--date-to',
+            type=datetime.date.fromisoformat,
+            help='終了日（YYYY-MM-DD、当日を含む）'
+        )
+        parser.add_argument(
+            '--output',
+            help='出力ファイル（省略時は標準出力）'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=EXPORT_CHUNK_SIZE,
+            help='DBから一度に読み込む行数'
+        )
+
+    def handle(self, *args, **options):
+        lines = iter_export(
+            options['kind'],
+            options['export_format'],
+            store_id=options.get('store_id'),
+            date_from=options.get('date_from'),
+            date_to=options.get('date_to'),
+            chunk_size=options['chunk_size']
+        )
+        output = options.get('output')
+        if output:
+            with open(output, 'w', encoding='utf-8', newline='') as f:
+                f.writelines(iter_batches(lines))
+            self.stderr.write(self.style.SUCCESS(f'✅ {output}に書き出しました'))
+        else:
+            for batch in iter_batches(lines):
+                self.stdout.write(batch, ending='')
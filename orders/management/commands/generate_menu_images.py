@@ -0,0 +1,113 @@
+"""
+メニュー画像の派生画像生成（既存データのバックフィル）管理コマンド
+"""
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import time
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+
+from orders.images import IMAGE_VARIANTS, InvalidImageError, render_variants, save_original, store_variants
+from orders.models import MenuItem, MenuItemImage
+
+
+class Command(BaseCommand):
+    help = 'メニュー画像のサムネイル・大サイズ画像（WebP・JPEG）を生成します'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--store-id',
+            type=int,
+            help='特定の店舗のメニューのみ生成'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='画像生成の並列プロセス数'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='生成済みのメニューも再生成'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        items = MenuItem.objects.annotate(
+            variant_count=Count(
+                'menuitemimage', filter=Q(menuitemimage__image_type__in=list(IMAGE_VARIANTS))
+            )
+        ).order_by('id')
+        if options['store_id']:
+            items = items.filter(store_id=options['store_id'])
+        if not options['force']:
+            items = items.filter(variant_count__lt=len(IMAGE_VARIANTS))
+
+        originals = dict(MenuItemImage.objects.filter(
+            image_type='original', menu_item__in=items.values('id')
+        ).values_list('menu_item_id', 'file_path'))
+
+        jobs = []
+        skipped = 0
+        for item in items:
+            path = originals.get(item.id) or self._register_original(item)
+            if path:
+                jobs.append((item, path))
+            else:
+                skipped += 1
+
+        workers = max(1, options['workers'])
+        generated = failed = 0
+        jobs_iter = iter(jobs)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # 元画像をメモリに載せすぎないよう、ワーカー数の2倍ずつ投入する
+            while batch := list(islice(jobs_iter, workers * 2)):
+                futures = []
+                for item, path in batch:
+                    try:
+                        futures.append((item, path, executor.submit(render_variants, self._read(path))))
+                    except (OSError, SuspiciousFileOperation) as e:
+                        # 元画像のファイルが失われている等。他のメニュー項目の生成は続ける
+                        failed += 1
+                        self.stderr.write(self.style.ERROR(f'  {item.name}: {e}'))
+                for item, path, future in futures:
+                    try:
+                        store_variants(item, future.result(), path)
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(self.style.ERROR(f'  {item.name}: {e}'))
+                        continue
+                    generated += 1
+                    if options['verbosity'] >= 2:
+                        self.stdout.write(f'  {item.name}: {item.image_thumbnail_path}')
+                self.stdout.write(f'  生成中... {generated + failed}/{len(jobs)}')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n✅ {generated}件のメニュー画像を生成しました '
+                f'(失敗: {failed}, 元画像なし: {skipped}, {elapsed:.2f}秒, {workers}プロセス)'
+            )
+        )
+
+    @staticmethod
+    def _read(path):
+        with default_storage.open(path, 'rb') as f:
+            return f.read()
+
+    def _register_original(self, item):
+        """image_pathのみ設定されたメニュー項目の画像を元画像として登録"""
+        if not item.image_path:
+            return None
+        try:
+            # 外部URL・絶対パスのimage_pathはストレージ外のためSuspiciousFileOperationになる
+            if not default_storage.exists(item.image_path):
+                return None
+            return save_original(item, self._read(item.image_path)).file_path
+        except (InvalidImageError, OSError, SuspiciousFileOperation) as e:
+            self.stderr.write(self.style.WARNING(f'  {item.name}: {e}'))
+            return None
@@ -1,11 +1,113 @@
 """
 QRコード生成管理コマンド
 """
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
-import qrcode
+from django.db.models import F
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
 from pathlib import Path
-from orders.models import Table
+from xml.sax.saxutils import escape
+import hashlib
+import json
+import time
+import qrcode
+from PIL import Image, ImageDraw, ImageFont
+from orders.caching import bump_table_index_version
+from orders.models import Store, Table
+from orders.qr_tokens import build_qr_code_url
+
+# QRコードの描画設定。変更した場合は全PNGが再生成される
+QR_OPTIONS = {
+    'error_correction': qrcode.constants.ERROR_CORRECT_L,
+    'box_size': 10,
+    'border': 4,
+}
+
+MANIFEST_NAME = 'manifest.json'
+
+# 印刷シートのレイアウト（A4縦・150dpi）
+SHEET_COLUMNS = 3
+SHEET_ROWS = 4
+SHEET_PAGE_SIZE = (1240, 1754)
+SHEET_CELL = 360
+SHEET_LABEL_HEIGHT = 40
+
+
+def qr_digest(qr_url: str) -> str:
+    """PNGの内容を決める入力（URLと描画設定）のハッシュ"""
+    source = json.dumps({'url': qr_url, 'options': QR_OPTIONS}, sort_keys=True)
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def _make_qr(qr_url: str) -> qrcode.QRCode:
+    qr = qrcode.QRCode(version=1, **QR_OPTIONS)
+    qr.add_data(qr_url)
+    qr.make(fit=True)
+    return qr
+
+
+def render_qr_png(qr_url: str, filepath: str):
+    """QRコードのPNGを書き出す（ワーカープロセスで実行）"""
+    img = _make_qr(qr_url).make_image(fill_color="black", back_color="white")
+    img.save(filepath)
+
+
+def render_svg_sheet(store_name: str, entries: list, filepath: str):
+    """店舗のQRコードを並べたSVGシートを書き出す（ワーカープロセスで実行）"""
+    width = SHEET_COLUMNS * SHEET_CELL
+    rows = -(-len(entries) // SHEET_COLUMNS)
+    height = SHEET_LABEL_HEIGHT + rows * (SHEET_CELL + SHEET_LABEL_HEIGHT)
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}">',
+        f'<rect width="{width}" height="{height}" fill="white"/>',
+        f'<text x="{width / 2}" y="28" font-size="24" text-anchor="middle">{escape(store_name)}</text>',
+    ]
+    for index, (table_number, qr_url) in enumerate(entries):
+        matrix = _make_qr(qr_url).get_matrix()
+        module = SHEET_CELL / len(matrix)
+        x0 = (index % SHEET_COLUMNS) * SHEET_CELL
+        y0 = SHEET_LABEL_HEIGHT + (index // SHEET_COLUMNS) * (SHEET_CELL + SHEET_LABEL_HEIGHT)
+        # 暗いモジュールを1つのパスにまとめて出力サイズを抑える
+        path = ''.join(
+            f'M{col} {row}h1v1h-1z'
+            for row, line in enumerate(matrix)
+            for col, dark in enumerate(line)
+            if dark
+        )
+        parts.append(
+            f'<path transform="translate({x0} {y0}) scale({module:.4f})" d="{path}"/>'
+        )
+        parts.append(
+            f'<text x="{x0 + SHEET_CELL / 2}" y="{y0 + SHEET_CELL + 28}" font-size="24" '
+            f'text-anchor="middle">{escape(table_number)}</text>'
+        )
+    parts.append('</svg>')
+    Path(filepath).write_text('\n'.join(parts), encoding='utf-8')
+
+
+def render_pdf_sheet(store_name: str, entries: list, filepath: str):
+    """店舗のQRコードを並べたPDFシートを書き出す（ワーカープロセスで実行）"""
+    font = ImageFont.load_default(size=28)
+    per_page = SHEET_COLUMNS * SHEET_ROWS
+    margin_x = (SHEET_PAGE_SIZE[0] - SHEET_COLUMNS * SHEET_CELL) // 2
+    pages = []
+    for start in range(0, len(entries), per_page):
+        page = Image.new('RGB', SHEET_PAGE_SIZE, 'white')
+        draw = ImageDraw.Draw(page)
+        for index, (table_number, qr_url) in enumerate(entries[start:start + per_page]):
+            img = _make_qr(qr_url).make_image(fill_color="black", back_color="white")
+            img = img.get_image().convert('RGB').resize((SHEET_CELL, SHEET_CELL), Image.NEAREST)
+            x = margin_x + (index % SHEET_COLUMNS) * SHEET_CELL
+            y = SHEET_LABEL_HEIGHT * 2 + (index // SHEET_COLUMNS) * (SHEET_CELL + SHEET_LABEL_HEIGHT)
+            page.paste(img, (x, y))
+            draw.text(
+                (x + SHEET_CELL / 2, y + SHEET_CELL + 4), table_number,
+                fill='black', font=font, anchor='ma'
+            )
+        pages.append(page)
+    pages[0].save(filepath, 'PDF', resolution=150, save_all=True, append_images=pages[1:])
 
 
 class Command(BaseCommand):
@@ -17,58 +119,143 @@ class Command(BaseCommand):
             type=int,
             help='特定のテーブルIDのみ生成'
         )
+        parser.add_argument(
+            '--store-id',
+            type=int,
+            help='特定の店舗のテーブルのみ生成'
+        )
+        parser.add_argument(
+            '--rotate',
+            action='store_true',
+            help='店舗のQRコード世代を進めて発行済みのQRコードを無効化（--store-idが必要）'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='画像生成の並列プロセス数'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='内容が変わっていないQRコードも再生成'
+        )
+        parser.add_argument(
+            '--sheet',
+            choices=['svg', 'pdf'],
+            action='append',
+            default=[],
+            help='店舗ごとの印刷用シートを出力（複数指定可）'
+        )
 
     def handle(self, *args, **options):
+        started = time.perf_counter()
         table_id = options.get('table_id')
-        
+        store_id = options.get('store_id')
+
+        if options['rotate']:
+            if not store_id:
+                raise CommandError('--rotateには--store-idを指定してください')
+            self._rotate(store_id)
+
+        tables = Table.objects.select_related('store').order_by('store_id', 'id')
         if table_id:
-            tables = Table.objects.filter(id=table_id)
-        else:
-            tables = Table.objects.all()
-        
-        if not tables.exists():
+            tables = tables.filter(id=table_id)
+        if store_id:
+            tables = tables.filter(store_id=store_id)
+        tables = list(tables)
+
+        if not tables:
             self.stdout.write(
                 self.style.WARNING('テーブルが見つかりません')
             )
             return
-        
+
         # QRコード保存先ディレクトリ作成
         qr_dir = Path(settings.MEDIA_ROOT) / 'qrcodes'
         qr_dir.mkdir(parents=True, exist_ok=True)
-        
+        manifest_path = qr_dir / MANIFEST_NAME
+        manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+
+        # 署名付きトークンを含むURLを求め、内容が変わったものだけ生成対象にする
+        jobs = []
+        changed_tables = []
         for table in tables:
-            # QRコードのURLを生成
-            qr_url = f"{settings.TELEGRAM_WEBHOOK_URL}/miniapp/?table_id={table.id}"
-            
-            # QRコード生成
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(qr_url)
-            qr.make(fit=True)
-            
-            img = qr.make_image(fill_color="black", back_color="white")
-            
-            # 保存
+            qr_url = build_qr_code_url(table.id, table.store_id, table.store.qr_epoch)
             filename = f"table_{table.id}_{table.table_number}.png"
-            filepath = qr_dir / filename
-            img.save(filepath)
-            
-            # テーブルのqr_code_urlを更新
-            table.qr_code_url = qr_url
-            table.save()
-            
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f'✅ テーブル {table.table_number}: {filepath}'
-                )
-            )
-        
+            digest = qr_digest(qr_url)
+            if options['force'] or manifest.get(filename) != digest or not (qr_dir / filename).exists():
+                jobs.append((table, qr_url, filename, digest))
+            if table.qr_code_url != qr_url:
+                table.qr_code_url = qr_url
+                changed_tables.append(table)
+
+        sheets = self._sheet_jobs(tables, qr_dir, options['sheet'])
+
+        workers = max(1, options['workers'])
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                (job, executor.submit(render_qr_png, job[1], str(qr_dir / job[2])))
+                for job in jobs
+            ]
+            sheet_futures = [
+                (filepath, executor.submit(render, name, entries, str(filepath)))
+                for render, name, entries, filepath in sheets
+            ]
+
+            progress_step = max(1, len(futures) // 10)
+            for done, ((table, qr_url, filename, digest), future) in enumerate(futures, 1):
+                future.result()
+                manifest[filename] = digest
+                if options['verbosity'] >= 2:
+                    self.stdout.write(f'  テーブル {table.table_number}: {qr_dir / filename}')
+                elif done % progress_step == 0 or done == len(futures):
+                    self.stdout.write(f'  生成中... {done}/{len(futures)}')
+
+            for filepath, future in sheet_futures:
+                future.result()
+                self.stdout.write(f'  シート: {filepath}')
+
+        manifest_path.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+
+        # テーブルのqr_code_urlを一括更新（シグナルが発生しないためインデックスは明示的に無効化）
+        if changed_tables:
+            Table.objects.bulk_update(changed_tables, ['qr_code_url'], batch_size=500)
+            bump_table_index_version()
+
+        elapsed = time.perf_counter() - started
         self.stdout.write(
             self.style.SUCCESS(
-                f'\n✅ {tables.count()}個のQRコードを生成しました'
+                f'\n✅ {len(tables)}個のテーブルを処理しました '
+                f'(生成: {len(jobs)}, 変更なし: {len(tables) - len(jobs)}, '
+                f'URL更新: {len(changed_tables)}, シート: {len(sheets)}, '
+                f'{elapsed:.2f}秒, {workers}プロセス)'
+            )
+        )
+
+    def _sheet_jobs(self, tables, qr_dir, formats):
+        """店舗ごとのシート生成ジョブ"""
+        renderers = {'svg': render_svg_sheet, 'pdf': render_pdf_sheet}
+        jobs = []
+        for _, store_tables in groupby(tables, key=lambda table: table.store_id):
+            store_tables = list(store_tables)
+            store = store_tables[0].store
+            entries = [(table.table_number, table.qr_code_url) for table in store_tables]
+            for sheet_format in dict.fromkeys(formats):
+                filepath = qr_dir / f"store_{store.id}_sheet.{sheet_format}"
+                jobs.append((renderers[sheet_format], store.name, entries, filepath))
+        return jobs
+
+    def _rotate(self, store_id):
+        """店舗のQRコード世代を進める"""
+        store = Store.objects.filter(id=store_id).first()
+        if store is None:
+            raise CommandError(f'店舗が見つかりません: {store_id}')
+        store.qr_epoch = F('qr_epoch') + 1
+        store.save(update_fields=['qr_epoch', 'updated_at'])
+        store.refresh_from_db(fields=['qr_epoch'])
+        self.stdout.write(
+            self.style.WARNING(
+                f'🔄 {store.name}のQRコード世代を{store.qr_epoch}に更新しました（旧QRコードは無効になります）'
             )
         )
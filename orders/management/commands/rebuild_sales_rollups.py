@@ -0,0 +1,24 @@
+"""
+売上集計の再構築管理コマンド
+"""
+from django.core.management.base import BaseCommand
+from orders.reports import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = '提供済みの注文・支払済みの会計から時間帯別の売上集計を作り直します'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--store-id',
+            type=int,
+            help='特定の店舗のみ再構築'
+        )
+
+    def handle(self, *args, **options):
+        hourly_count, item_count = rebuild_rollups(options.get('store_id'))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✅ 売上集計を再構築しました（時間帯別: {hourly_count}行, 商品別: {item_count}行）'
+            )
+        )
@@ -0,0 +1,104 @@
+"""
+セッション集計列の検証・修復管理コマンド
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Sum, Count, F
+from django.db.models.functions import Coalesce
+from decimal import Decimal
+from orders.models import Session, Order, OrderItem
+
+
+def sessions_with_expected_totals():
+    """注文から再計算した集計値を付与したセッションのクエリセット"""
+    orders = Order.objects.filter(
+        session=OuterRef('pk')
+    ).exclude(status='cancelled').values('session')
+    items = OrderItem.objects.filter(
+        order__session=OuterRef('pk')
+    ).exclude(order__status='cancelled').values('order__session')
+    return Session.objects.annotate(
+        expected_subtotal_amount=Coalesce(
+            Subquery(orders.annotate(total=Sum('total_amount')).values('total')),
+            Decimal('0.00')
+        ),
+        expected_order_count=Coalesce(
+            Subquery(orders.annotate(count=Count('pk')).values('count')), 0
+        ),
+        expected_item_count=Coalesce(
+            Subquery(items.annotate(total=Sum('quantity')).values('total')), 0
+        )
+    )
+
+
+class Command(BaseCommand):
+    help = 'セッションの注文集計列（合計金額・注文数・品数）を注文データと照合します'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='不一致のセッションを修復'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='一括更新の件数'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        mismatched = sessions_with_expected_totals().exclude(
+            subtotal_amount=F('expected_subtotal_amount'),
+            order_count=F('expected_order_count'),
+            item_count=F('expected_item_count')
+        ).only('id', 'session_code', 'subtotal_amount', 'order_count', 'item_count').order_by('id')
+
+        found = 0
+        batch = []
+        for session in mismatched.iterator(chunk_size=batch_size):
+            found += 1
+            self.stdout.write(
+                f'{session.session_code}: '
+                f'合計 {session.subtotal_amount} → {session.expected_subtotal_amount}, '
+                f'注文数 {session.order_count} → {session.expected_order_count}, '
+                f'品数 {session.item_count} → {session.expected_item_count}'
+            )
+            if options['fix']:
+                batch.append(session)
+                if len(batch) >= batch_size:
+                    self._repair(batch)
+                    batch = []
+        if batch:
+            self._repair(batch)
+
+        if not found:
+            self.stdout.write(self.style.SUCCESS('✅ 全セッションの集計列は一致しています'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'✅ {found}件のセッションを修復しました'))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'⚠️ {found}件のセッションが不一致です（--fixで修復）'
+            ))
+
+    @staticmethod
+    def _repair(sessions):
+        # 照合後に注文が追加・キャンセルされていても正しい値になるよう、
+        # 行をロックしてから再計算した値で更新する
+        with transaction.atomic():
+            locked = sessions_with_expected_totals().select_for_update().filter(
+                pk__in=[session.pk for session in sessions]
+            )
+            Session.objects.bulk_update(
+                [
+                    Session(
+                        pk=session.pk,
+                        subtotal_amount=session.expected_subtotal_amount,
+                        order_count=session.expected_order_count,
+                        item_count=session.expected_item_count
+                    )
+                    for session in locked
+                ],
+                ['subtotal_amount', 'order_count', 'item_count']
+            )
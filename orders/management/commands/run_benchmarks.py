@@ -0,0 +1,97 @@
+"""
+注文フローのベンチマーク実行管理コマンド
+"""
+import json
+import platform
+from io import StringIO
+from pathlib import Path
+
+import django
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from orders.benchmarks import SCENARIOS, BenchmarkError, run_benchmarks
+
+# 本番のキャッシュ（メニュー・テーブルインデックスのバージョン等）を変更しないよう、計測中は専用のキャッシュを使う
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+
+
+class Command(BaseCommand):
+    help = 'テスト用データベースにデータを生成し、注文フローのレイテンシとクエリ数を計測します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stores', type=int, default=3, help='店舗数')
+        parser.add_argument('--tables', type=int, default=20, help='店舗あたりのテーブル数')
+        parser.add_argument('--menu-items', type=int, default=50, help='店舗あたりのメニュー項目数')
+        parser.add_argument('--history', type=int, default=200, help='店舗あたりの会計済みセッション数')
+        parser.add_argument('--iterations', type=int, default=50, help='シナリオあたりの計測回数')
+        parser.add_argument('--warmup', type=int, default=3, help='計測前の実行回数')
+        parser.add_argument('--lines', type=int, default=3, help='注文作成1回あたりの明細数')
+        parser.add_argument(
+            '--scenario',
+            choices=SCENARIOS,
+            action='append',
+            help='計測するシナリオ（複数指定可。省略時は全シナリオ）'
+        )
+        parser.add_argument('--output', help='結果のJSONの出力先（省略時は標準出力）')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterationsは1以上を指定してください')
+
+        # 本番データに影響しないよう、テスト用データベース・キャッシュを作成して計測する
+        setup_test_environment()
+        cache_settings = override_settings(CACHES=BENCHMARK_CACHES)
+        cache_settings.enable()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stderr.write('テストデータを生成中...')
+            call_command(
+                'create_test_data',
+                stores=options['stores'],
+                tables=options['tables'],
+                menu_items=options['menu_items'],
+                history=options['history'],
+                stdout=StringIO()
+            )
+            self.stderr.write('計測中...')
+            results = run_benchmarks(
+                scenarios=options['scenario'],
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                lines=options['lines']
+            )
+        except BenchmarkError as e:
+            raise CommandError(str(e))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            cache_settings.disable()
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'scale': {
+                    key: options[key]
+                    for key in ('stores', 'tables', 'menu_items', 'history', 'iterations', 'warmup', 'lines')
+                },
+            },
+            'results': results,
+        }
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            Path(options['output']).write_text(output + '\n', encoding='utf-8')
+            self.stderr.write(self.style.SUCCESS(f"✅ 結果を{options['output']}に出力しました"))
+        else:
+            self.stdout.write(output)
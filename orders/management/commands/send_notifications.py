@@ -0,0 +1,41 @@
+"""
+通知Outbox送信管理コマンド
+"""
+from django.core.management.base import BaseCommand
+import asyncio
+from orders.notifications import NotificationDispatcher
+from orders.telegram_bot import telegram_bot
+
+
+class Command(BaseCommand):
+    help = 'Outboxに溜まった通知をTelegramへ送信します'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='送信待ちの通知を1巡だけ送信して終了'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='送信待ちがない場合の待機秒数'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('通知送信ワーカーを起動します...')
+        asyncio.run(self._run(options['once'], options['interval']))
+
+    async def _run(self, once, interval):
+        dispatcher = NotificationDispatcher(telegram_bot.send_message)
+        try:
+            if once:
+                sent = await dispatcher.drain()
+                self.stdout.write(
+                    self.style.SUCCESS(f'✅ {sent}件の通知を送信しました')
+                )
+            else:
+                await dispatcher.run(interval)
+        finally:
+            await telegram_bot.shutdown()
@@ -13,7 +13,7 @@ class Command(BaseCommand):
         self.stdout.write('Telegram Webhook設定中...')
         
         try:
-            asyncio.run(telegram_bot.set_webhook())
+            asyncio.run(self._set_webhook())
             self.stdout.write(
                 self.style.SUCCESS('✅ Webhook設定完了')
             )
@@ -21,3 +21,10 @@ class Command(BaseCommand):
             self.stdout.write(
                 self.style.ERROR(f'❌ エラー: {e}')
             )
+    
+    async def _set_webhook(self):
+        try:
+            await telegram_bot.set_webhook()
+        finally:
+            # 接続プールを閉じてからイベントループを終了する
+            await telegram_bot.shutdown()
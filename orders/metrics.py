@@ -0,0 +1,222 @@
+"""
+リクエストごとの処理時間・クエリ数の計測
+
+ミドルウェアでビューの処理時間、DBクエリ数・DB時間（connection.execute_wrapper）を
+計測してServer-Timingヘッダーで返し、ルートごとのヒストグラムをプロセス内に集計する。
+集計は/metricsでPrometheusのテキスト形式で公開する（値はワーカープロセスごと）。
+
+DB接続はスレッドごとのため、ASGIでビューが別スレッド（sync_to_async）で実行されても
+計測できるよう、クエリの記録関数は各スレッドの接続に登録し、計測中のリクエストは
+コンテキスト変数で受け渡す。
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+# ヒストグラムのバケット（上限値）
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# (メトリクス名, 説明, バケット)
+METRICS = (
+    ('http_request_duration_seconds', 'リクエストの処理時間（秒）', DURATION_BUCKETS),
+    ('http_request_db_duration_seconds', 'リクエスト中のDBクエリの合計時間（秒）', DURATION_BUCKETS),
+    ('http_request_db_queries', 'リクエスト中のDBクエリ数', QUERY_BUCKETS),
+)
+
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+class Histogram:
+    """累積前のバケット別件数・合計・件数"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels) -> str:
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in labels)
+
+
+class MetricsRegistry:
+    """ルート・メソッド・ステータスごとのヒストグラム"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {name: {} for name, _, _ in METRICS}
+
+    def observe_request(self, route: str, method: str, status: int,
+                        duration: float, db_duration: float, queries: int):
+        labels = (('route', route), ('method', method), ('status', str(status)))
+        with self._lock:
+            for (name, _, buckets), value in zip(METRICS, (duration, db_duration, queries)):
+                histogram = self._series[name].get(labels)
+                if histogram is None:
+                    histogram = self._series[name][labels] = Histogram(buckets)
+                histogram.observe(value)
+
+    def render(self) -> str:
+        """Prometheusのテキスト形式"""
+        lines = []
+        with self._lock:
+            for name, help_text, buckets in METRICS:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for labels, histogram in sorted(self._series[name].items()):
+                    label_text = _format_labels(labels)
+                    cumulative = 0
+                    for bound, count in zip((*buckets, '+Inf'), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{label_text}}} {float(histogram.sum)!r}')
+                    lines.append(f'{name}_count{{{label_text}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            for series in self._series.values():
+                series.clear()
+
+
+# グローバルインスタンス
+metrics_registry = MetricsRegistry()
+
+
+class QueryTimer:
+    """実行したクエリの件数と合計時間"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+# 計測中のリクエストのQueryTimer（sync_to_asyncで実行されるビューにも引き継がれる）
+_current_timer = ContextVar('query_timer', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """計測中のリクエストがあればクエリの件数と時間を加算するexecute_wrapper"""
+    timer = _current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.duration += time.perf_counter() - started
+        timer.count += 1
+
+
+def _install(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    _install(connection)
+
+
+@receiver(request_started)
+def install_query_recorders(sender, **kwargs):
+    """リクエストを処理するスレッドの接続に記録関数を登録（接続済みの場合に備える）"""
+    for connection in connections.all():
+        _install(connection)
+
+
+class RequestMetricsMiddleware:
+    """
+    リクエストの処理時間・クエリ数の計測ミドルウェア
+
+    ストリーミングレスポンスはレスポンスを返すまで（本文の送信前）を計測する。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer, started = QueryTimer(), time.perf_counter()
+        token = _current_timer.set(timer)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_timer.reset(token)
+        self._record(request, response, timer, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        timer, started = QueryTimer(), time.perf_counter()
+        token = _current_timer.set(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_timer.reset(token)
+        self._record(request, response, timer, time.perf_counter() - started)
+        return response
+
+    def _record(self, request, response, timer, duration):
+        match = getattr(request, 'resolver_match', None)
+        route = (match.view_name or match.route) if match else UNMATCHED_ROUTE
+        metrics_registry.observe_request(
+            route, request.method, response.status_code, duration, timer.duration, timer.count
+        )
+
+        timing = (
+            f'app;dur={duration * 1000:.1f}, '
+            f'db;dur={timer.duration * 1000:.1f};desc="{timer.count} queries"'
+        )
+        if response.has_header('Server-Timing'):
+            timing = f"{response['Server-Timing']}, {timing}"
+        response['Server-Timing'] = timing
+
+        threshold = getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', 500)
+        if threshold is not None and duration * 1000 >= threshold:
+            logger.warning(
+                f"遅いリクエスト: {request.method} {request.path} ({route}) "
+                f"{duration * 1000:.1f}ms, クエリ{timer.count}件 {timer.duration * 1000:.1f}ms"
+            )
+
+
+def metrics_view(request):
+    """Prometheus形式のメトリクス（METRICS_TOKENのBearerトークンまたはis_staffのログインが必要）"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorized = bool(token) and constant_time_compare(
+        request.headers.get('Authorization', ''), f'Bearer {token}'
+    )
+    if not authorized and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(
+        metrics_registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,40 @@
+# Generated by Django 5.0 on 2026-10-18 12:31
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_next_order_number(apps, schema_editor):
+    Session = apps.get_model('orders', 'Session')
+    Order = apps.get_model('orders', 'Order')
+    last_order_number = Order.objects.filter(
+        session=OuterRef('pk')
+    ).values('session').annotate(last=Max('order_number')).values('last')
+    Session.objects.update(
+        next_order_number=Coalesce(Subquery(last_order_number), 0) + 1
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_session_836fd1_idx',
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='next_order_number',
+            field=models.IntegerField(default=1, help_text='セッション内の注文番号採番用', verbose_name='次の注文番号'),
+        ),
+        migrations.RunPython(backfill_next_order_number, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(fields=('session', 'order_number'), name='order_session_order_number_uniq'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.0 on 2026-10-18 12:41
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Count
+from django.db.models.functions import Coalesce
+
+
+def backfill_session_totals(apps, schema_editor):
+    Session = apps.get_model('orders', 'Session')
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    orders = Order.objects.filter(
+        session=OuterRef('pk')
+    ).exclude(status='cancelled').values('session')
+    items = OrderItem.objects.filter(
+        order__session=OuterRef('pk')
+    ).exclude(order__status='cancelled').values('order__session')
+    Session.objects.update(
+        subtotal_amount=Coalesce(
+            Subquery(orders.annotate(total=Sum('total_amount')).values('total')),
+            Decimal('0.00')
+        ),
+        order_count=Coalesce(Subquery(orders.annotate(count=Count('pk')).values('count')), 0),
+        item_count=Coalesce(Subquery(items.annotate(total=Sum('quantity')).values('total')), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='item_count',
+            field=models.IntegerField(default=0, help_text='キャンセルを除く注文明細の数量合計', verbose_name='注文品数'),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='order_count',
+            field=models.IntegerField(default=0, help_text='キャンセルを除く注文の件数', verbose_name='注文数'),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='subtotal_amount',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='キャンセルを除く注文の合計', max_digits=10, verbose_name='注文合計金額'),
+        ),
+        migrations.RunPython(backfill_session_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-18 12:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_session_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='store',
+            name='qr_epoch',
+            field=models.PositiveIntegerField(default=0, help_text='進めると発行済みのQRトークンが無効になる', verbose_name='QRコード世代'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.0 on 2026-10-18 12:49
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_store_qr_epoch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(help_text='集計対象の時刻（時単位に切り捨て）', verbose_name='時間帯')),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='支払済み会計の合計', max_digits=12, verbose_name='売上')),
+                ('payment_count', models.IntegerField(default=0, verbose_name='会計数')),
+                ('guest_count', models.IntegerField(default=0, verbose_name='来店客数')),
+                ('order_count', models.IntegerField(default=0, help_text='提供済みの注文数', verbose_name='注文数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='orders.store', verbose_name='店舗')),
+            ],
+            options={
+                'verbose_name': '時間帯別売上',
+                'verbose_name_plural': '時間帯別売上',
+                'db_table': 'sales_hourly',
+            },
+        ),
+        migrations.CreateModel(
+            name='SalesHourlyItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(help_text='集計対象の時刻（時単位に切り捨て）', verbose_name='時間帯')),
+                ('menu_item_name', models.CharField(max_length=100, verbose_name='商品名')),
+                ('quantity', models.IntegerField(default=0, verbose_name='数量')),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='売上')),
+                ('order_count', models.IntegerField(default=0, verbose_name='注文数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('menu_item', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='orders.menuitem', verbose_name='メニュー項目')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='orders.store', verbose_name='店舗')),
+            ],
+            options={
+                'verbose_name': '時間帯別商品売上',
+                'verbose_name_plural': '時間帯別商品売上',
+                'db_table': 'sales_hourly_item',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='saleshourly',
+            constraint=models.UniqueConstraint(fields=('store', 'hour'), name='sales_hourly_store_hour_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='saleshourlyitem',
+            constraint=models.UniqueConstraint(fields=('store', 'hour', 'menu_item'), name='sales_hourly_item_uniq'),
+        ),
+    ]
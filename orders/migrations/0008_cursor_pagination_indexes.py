@@ -0,0 +1,37 @@
+# Generated by Django 5.0 on 2026-10-18 12:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='session',
+            name='session_started_cb867d_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='staffcall',
+            name='staff_call_called__2bd339_idx',
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['ordered_at', 'id'], name='order_ordered_4172c4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['requested_at', 'id'], name='payment_request_6328d6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['started_at', 'id'], name='session_started_7ae640_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staffcall',
+            index=models.Index(fields=['called_at', 'id'], name='staff_call_called__67236e_idx'),
+        ),
+    ]
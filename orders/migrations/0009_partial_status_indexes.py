@@ -0,0 +1,42 @@
+# Generated by Django 5.0 on 2026-10-18 12:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_cursor_pagination_indexes'),
+    ]
+
+    operations = [
+        # 初回取得は未提供の注文の部分インデックス、since以降の差分取得は(updated_at, id)で引く
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_status_d71763_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_updated_41da6d_idx',
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['updated_at', 'id'], name='order_updated_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'cooking', 'ready'])), fields=['updated_at', 'id'], name='order_open_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'cooking', 'ready'])), fields=['session', 'ordered_at'], name='order_session_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(condition=models.Q(('status__in', ['active', 'calling_staff', 'payment_requested'])), fields=['table'], name='session_table_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staffcall',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['called_at', 'id'], name='staff_call_pending_idx'),
+        ),
+    ]
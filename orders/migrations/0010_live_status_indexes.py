@@ -0,0 +1,21 @@
+# Generated by Django 5.0 on 2026-10-18 12:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_partial_status_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['requested_at', 'id'], name='payment_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(condition=models.Q(('status__in', ['active', 'calling_staff', 'payment_requested'])), fields=['telegram_chat_id'], name='session_chat_active_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-18 13:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_live_status_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='menuitemimage',
+            name='fallback_path',
+            field=models.CharField(blank=True, default='', help_text='WebP非対応端末向けのJPEG', max_length=500, verbose_name='代替ファイルパス'),
+        ),
+    ]
@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, connection
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator
 from decimal import Decimal
@@ -11,6 +13,7 @@ class Store(models.Model):
     phone = models.CharField('電話番号', max_length=20, blank=True, null=True)
     business_hours = models.TextField('営業時間', blank=True, null=True, help_text='JSON形式')
     is_active = models.BooleanField('営業中フラグ', default=True)
+    qr_epoch = models.PositiveIntegerField('QRコード世代', default=0, help_text='進めると発行済みのQRトークンが無効になる')
     created_at = models.DateTimeField('作成日時', auto_now_add=True)
     updated_at = models.DateTimeField('更新日時', auto_now=True)
 
@@ -107,6 +110,7 @@ class MenuItemImage(models.Model):
     menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, verbose_name='メニュー項目')
     image_type = models.CharField('画像タイプ', max_length=20, choices=IMAGE_TYPE_CHOICES)
     file_path = models.CharField('ファイルパス', max_length=500)
+    fallback_path = models.CharField('代替ファイルパス', max_length=500, blank=True, default='', help_text='WebP非対応端末向けのJPEG')
     file_size = models.IntegerField('ファイルサイズ', help_text='バイト')
     width = models.IntegerField('画像幅', blank=True, null=True, help_text='ピクセル')
     height = models.IntegerField('画像高さ', blank=True, null=True, help_text='ピクセル')
@@ -128,6 +132,13 @@ class MenuItemImage(models.Model):
         return f"{self.menu_item.name} - {self.get_image_type_display()}"
 
 
+# 来店中（未終了）のセッションのステータス
+ACTIVE_SESSION_STATUSES = ['active', 'calling_staff', 'payment_requested']
+
+# 未提供の注文のステータス
+OPEN_ORDER_STATUSES = ['pending', 'cooking', 'ready']
+
+
 class Session(models.Model):
     """来店セッション"""
     STATUS_CHOICES = [
@@ -137,6 +148,7 @@ class Session(models.Model):
         ('completed', '完了'),
         ('cancelled', 'キャンセル'),
     ]
+    ACTIVE_STATUSES = ACTIVE_SESSION_STATUSES
 
     store = models.ForeignKey(Store, on_delete=models.CASCADE, verbose_name='店舗')
     table = models.ForeignKey(Table, on_delete=models.CASCADE, verbose_name='テーブル')
@@ -144,6 +156,10 @@ class Session(models.Model):
     party_size = models.IntegerField('来店人数')
     telegram_chat_id = models.CharField('Telegram Chat ID', max_length=50, blank=True, null=True)
     status = models.CharField('ステータス', max_length=20, choices=STATUS_CHOICES, default='active')
+    next_order_number = models.IntegerField('次の注文番号', default=1, help_text='セッション内の注文番号採番用')
+    subtotal_amount = models.DecimalField('注文合計金額', max_digits=10, decimal_places=2, default=Decimal('0.00'), help_text='キャンセルを除く注文の合計')
+    order_count = models.IntegerField('注文数', default=0, help_text='キャンセルを除く注文の件数')
+    item_count = models.IntegerField('注文品数', default=0, help_text='キャンセルを除く注文明細の数量合計')
     started_at = models.DateTimeField('来店日時')
     ended_at = models.DateTimeField('退店日時', blank=True, null=True)
     created_at = models.DateTimeField('作成日時', auto_now_add=True)
@@ -155,12 +171,61 @@ class Session(models.Model):
         verbose_name_plural = 'セッション'
         indexes = [
             models.Index(fields=['table', 'status']),
-            models.Index(fields=['started_at']),
+            # 一覧のカーソルページネーション用
+            models.Index(fields=['started_at', 'id']),
+            # 来店中のセッションのみの部分インデックス（テーブルの利用中判定用）
+            models.Index(
+                fields=['table'],
+                name='session_table_active_idx',
+                condition=Q(status__in=ACTIVE_SESSION_STATUSES)
+            ),
+            # Telegramユーザーの来店中セッションの検索用
+            models.Index(
+                fields=['telegram_chat_id'],
+                name='session_chat_active_idx',
+                condition=Q(status__in=ACTIVE_SESSION_STATUSES)
+            ),
         ]
 
     def __str__(self):
         return f"{self.table} - {self.session_code}"
 
+    def allocate_order_number(self) -> int:
+        """
+        セッション内の注文番号を採番
+
+        カウンタ列をDB上でアトミックに加算するため、同じテーブルから
+        同時に注文されても番号が重複せず、リトライも不要。
+        """
+        if connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert:
+            table = connection.ops.quote_name(self._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {table} SET next_order_number = next_order_number + 1 '
+                    f'WHERE id = %s RETURNING next_order_number - 1',
+                    [self.pk]
+                )
+                return cursor.fetchone()[0]
+        
+        # RETURNING非対応DB: UPDATEで行ロックを取得したまま読み戻す
+        sessions = Session.objects.filter(pk=self.pk)
+        sessions.update(next_order_number=F('next_order_number') + 1)
+        return sessions.values_list('next_order_number', flat=True).get() - 1
+
+    def add_to_totals(self, amount, order_count: int, item_count: int):
+        """
+        注文の集計列をDB上で加減算
+
+        同時に注文・キャンセルされても取りこぼさないようF式で更新し、
+        更新後の値をインスタンスに読み戻す。
+        """
+        Session.objects.filter(pk=self.pk).update(
+            subtotal_amount=F('subtotal_amount') + amount,
+            order_count=F('order_count') + order_count,
+            item_count=F('item_count') + item_count
+        )
+        self.refresh_from_db(fields=['subtotal_amount', 'order_count', 'item_count'])
+
 
 class Order(models.Model):
     """注文"""
@@ -171,6 +236,7 @@ class Order(models.Model):
         ('served', '提供済み'),
         ('cancelled', 'キャンセル'),
     ]
+    OPEN_STATUSES = OPEN_ORDER_STATUSES
 
     session = models.ForeignKey(Session, on_delete=models.CASCADE, verbose_name='セッション')
     telegram_user_id = models.CharField('Telegram User ID', max_length=50, blank=True, null=True)
@@ -192,13 +258,40 @@ class Order(models.Model):
         verbose_name = '注文'
         verbose_name_plural = '注文'
         indexes = [
-            models.Index(fields=['session', 'order_number']),
             models.Index(fields=['status', 'ordered_at']),
+            # 一覧のカーソルページネーション用
+            models.Index(fields=['ordered_at', 'id']),
+            # 調理ダッシュボードのsince以降の差分取得用（提供済み・キャンセルも返すため全注文）
+            models.Index(fields=['updated_at', 'id'], name='order_updated_id_idx'),
+            # 未提供の注文のみの部分インデックス（調理ダッシュボードの初回取得・未提供一覧用）
+            models.Index(
+                fields=['updated_at', 'id'],
+                name='order_open_updated_idx',
+                condition=Q(status__in=OPEN_ORDER_STATUSES)
+            ),
+            models.Index(
+                fields=['session', 'ordered_at'],
+                name='order_session_open_idx',
+                condition=Q(status__in=OPEN_ORDER_STATUSES)
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'order_number'], name='order_session_order_number_uniq'),
         ]
 
     def __str__(self):
         return f"{self.session} - 注文{self.order_number}"
 
+    def update_session_totals(self, previous_status: str):
+        """キャンセル・キャンセル取り消しをセッションの集計列に反映"""
+        was_counted = previous_status != 'cancelled'
+        is_counted = self.status != 'cancelled'
+        if was_counted == is_counted:
+            return
+        sign = 1 if is_counted else -1
+        quantity = self.items.aggregate(total=Coalesce(Sum('quantity'), 0))['total']
+        self.session.add_to_totals(sign * self.total_amount, sign, sign * quantity)
+
 
 class OrderItem(models.Model):
     """注文明細"""
@@ -266,7 +359,14 @@ class StaffCall(models.Model):
         verbose_name_plural = '店員呼び出し'
         indexes = [
             models.Index(fields=['session', 'status']),
-            models.Index(fields=['called_at']),
+            # 一覧のカーソルページネーション用
+            models.Index(fields=['called_at', 'id']),
+            # 対応待ちの呼び出しのみの部分インデックス（一覧と同じ並び順）
+            models.Index(
+                fields=['called_at', 'id'],
+                name='staff_call_pending_idx',
+                condition=Q(status='pending')
+            ),
         ]
 
     def __str__(self):
@@ -302,12 +402,95 @@ class Payment(models.Model):
         verbose_name_plural = '会計'
         indexes = [
             models.Index(fields=['status', 'requested_at']),
+            # 一覧のカーソルページネーション用
+            models.Index(fields=['requested_at', 'id']),
+            # 会計待ちのみの部分インデックス（一覧と同じ並び順）
+            models.Index(
+                fields=['requested_at', 'id'],
+                name='payment_pending_idx',
+                condition=Q(status='pending')
+            ),
         ]
 
     def __str__(self):
         return f"{self.session} - ¥{self.total_amount}"
 
 
+class Notification(models.Model):
+    """Telegram通知送信キュー（Outbox）"""
+    STATUS_CHOICES = [
+        ('pending', '送信待ち'),
+        ('sent', '送信済み'),
+        ('failed', '送信失敗'),
+    ]
+
+    chat_id = models.CharField('送信先チャットID', max_length=50)
+    message = models.TextField('メッセージ')
+    status = models.CharField('ステータス', max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField('送信試行回数', default=0)
+    next_attempt_at = models.DateTimeField('次回送信日時')
+    last_error = models.TextField('最終エラー', blank=True, null=True)
+    sent_at = models.DateTimeField('送信日時', blank=True, null=True)
+    created_at = models.DateTimeField('作成日時', auto_now_add=True)
+    updated_at = models.DateTimeField('更新日時', auto_now=True)
+
+    class Meta:
+        db_table = 'notification_outbox'
+        verbose_name = '通知'
+        verbose_name_plural = '通知'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.chat_id} - {self.get_status_display()}"
+
+
+class SalesHourly(models.Model):
+    """時間帯別売上集計（店舗×時間）"""
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, verbose_name='店舗')
+    hour = models.DateTimeField('時間帯', help_text='集計対象の時刻（時単位に切り捨て）')
+    revenue = models.DecimalField('売上', max_digits=12, decimal_places=2, default=Decimal('0.00'), help_text='支払済み会計の合計')
+    payment_count = models.IntegerField('会計数', default=0)
+    guest_count = models.IntegerField('来店客数', default=0)
+    order_count = models.IntegerField('注文数', default=0, help_text='提供済みの注文数')
+    updated_at = models.DateTimeField('更新日時', auto_now=True)
+
+    class Meta:
+        db_table = 'sales_hourly'
+        verbose_name = '時間帯別売上'
+        verbose_name_plural = '時間帯別売上'
+        constraints = [
+            models.UniqueConstraint(fields=['store', 'hour'], name='sales_hourly_store_hour_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.store_id} - {self.hour}"
+
+
+class SalesHourlyItem(models.Model):
+    """時間帯別商品売上集計（店舗×時間×メニュー項目）"""
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, verbose_name='店舗')
+    hour = models.DateTimeField('時間帯', help_text='集計対象の時刻（時単位に切り捨て）')
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.SET_NULL, null=True, verbose_name='メニュー項目')
+    menu_item_name = models.CharField('商品名', max_length=100)
+    quantity = models.IntegerField('数量', default=0)
+    revenue = models.DecimalField('売上', max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    order_count = models.IntegerField('注文数', default=0)
+    updated_at = models.DateTimeField('更新日時', auto_now=True)
+
+    class Meta:
+        db_table = 'sales_hourly_item'
+        verbose_name = '時間帯別商品売上'
+        verbose_name_plural = '時間帯別商品売上'
+        constraints = [
+            models.UniqueConstraint(fields=['store', 'hour', 'menu_item'], name='sales_hourly_item_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.store_id} - {self.hour} - {self.menu_item_name}"
+
+
 class User(AbstractUser):
     """ユーザー/店舗スタッフ"""
     ROLE_CHOICES = [
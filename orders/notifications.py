@@ -0,0 +1,278 @@
+"""
+Telegram通知のOutbox
+
+通知は注文・店員呼び出しと同じトランザクションでOutboxテーブルに書き込み、
+send_notificationsコマンドのワーカーがTelegramのレート制限を守りながら送信する。
+メッセージには商品名・呼び出しメッセージ等の利用者の入力が含まれるため、
+書式（parse_mode）を指定せずプレーンテキストで送信する。
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+# Telegramの1メッセージあたりの最大文字数
+MAX_MESSAGE_LENGTH = 4096
+
+ORDER_STATUS_TEXT = {
+    'pending': '⏳ 受付済み',
+    'cooking': '👨‍🍳 調理中',
+    'ready': '✅ 調理完了',
+    'served': '🍽️ 提供済み',
+    'cancelled': '❌ キャンセル',
+}
+
+STAFF_CALL_REASON_TEXT = {
+    'water': '💧 お水',
+    'payment': '💳 会計',
+    'question': '❓ 質問',
+    'complaint': '⚠️ 苦情',
+    'other': '📝 その他',
+}
+
+
+def enqueue_notification(chat_id, message: str):
+    """
+    通知をOutboxに登録
+
+    呼び出し元のトランザクション内で書き込むため、注文等の登録が
+    ロールバックされた場合は通知も送信されない。
+    """
+    if not chat_id:
+        return None
+    return Notification.objects.create(
+        chat_id=str(chat_id),
+        message=message,
+        next_attempt_at=timezone.now()
+    )
+
+
+def order_created_message(order, items) -> str:
+    """注文受付の通知メッセージ"""
+    items_text = "\n".join(
+        f"• {item.menu_item_name} x{item.quantity}"
+        for item in items
+    )
+    return (
+        f"🔔 注文を受け付けました\n\n"
+        f"テーブル: {order.session.table.table_number}\n"
+        f"注文番号: #{order.order_number}\n\n"
+        f"{items_text}\n\n"
+        f"合計: ¥{order.total_amount:,.0f}"
+    )
+
+
+def order_status_message(order) -> str:
+    """注文ステータス変更の通知メッセージ"""
+    status_text = ORDER_STATUS_TEXT.get(order.status, order.get_status_display())
+    return f"注文 #{order.order_number}: {status_text}"
+
+
+def staff_call_message(staff_call) -> str:
+    """店員呼び出しの通知メッセージ"""
+    reason_text = STAFF_CALL_REASON_TEXT.get(staff_call.reason, staff_call.reason)
+    message = (
+        f"🔔 店員呼び出し\n\n"
+        f"テーブル: {staff_call.session.table.table_number}\n"
+        f"理由: {reason_text}"
+    )
+    if staff_call.message:
+        message += f"\n\n{staff_call.message}"
+    return message
+
+
+class TokenBucket:
+    """トークンバケットによる送信レート制限"""
+
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self) -> bool:
+        self._refill()
+        return self.tokens >= 1
+
+    def consume(self):
+        self._refill()
+        self.tokens -= 1
+
+
+class NotificationDispatcher:
+    """
+    Outboxの通知をまとめて送信するワーカー
+
+    同じチャット宛ての送信待ち通知は1通にまとめ、全体とチャットごとの
+    トークンバケットで送信レートを制限する。送信に失敗した通知は
+    指数バックオフで再送し、上限回数を超えたら送信失敗とする。
+
+    取得した通知は次回送信日時をNOTIFICATION_CLAIM_TIMEOUT秒後に進めて確保するため、
+    複数のワーカーを起動しても同じ通知を二重に送信しない。
+    """
+
+    def __init__(self, send, clock=time.monotonic):
+        """
+        Args:
+            send: メッセージ送信コルーチン関数 send(chat_id, text)
+        """
+        self.send = send
+        self.clock = clock
+        self.global_bucket = TokenBucket(
+            settings.NOTIFICATION_GLOBAL_RATE,
+            settings.NOTIFICATION_GLOBAL_RATE,
+            clock
+        )
+        self.chat_buckets = {}
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        if chat_id not in self.chat_buckets:
+            self.chat_buckets[chat_id] = TokenBucket(
+                settings.NOTIFICATION_PER_CHAT_RATE,
+                1,
+                self.clock
+            )
+        return self.chat_buckets[chat_id]
+
+    async def drain(self) -> int:
+        """
+        送信時刻になった通知を1巡分送信
+
+        Returns:
+            送信済みにした通知の件数
+        """
+        notifications = await sync_to_async(self._claim_due)()
+        by_chat = defaultdict(list)
+        for notification in notifications:
+            by_chat[notification.chat_id].append(notification)
+
+        sent = 0
+        unsent = []
+        for chat_id, pending in by_chat.items():
+            chat_bucket = self._chat_bucket(chat_id)
+            if not chat_bucket.available() or not self.global_bucket.available():
+                unsent.extend(pending)
+                continue
+            chat_bucket.consume()
+            self.global_bucket.consume()
+
+            batch, text = self._coalesce(pending)
+            unsent.extend(pending[len(batch):])
+            sent += await self._send_batch(chat_id, batch, text)
+
+        if unsent:
+            # レート制限で送れなかった通知は確保を解除して次の巡回で送る
+            await sync_to_async(self._release)(unsent)
+        return sent
+
+    async def _send_batch(self, chat_id, batch, text) -> int:
+        """まとめた通知を送信して結果を記録し、送信済みにした件数を返す"""
+        try:
+            await self.send(chat_id, text)
+        except RetryAfter as e:
+            await sync_to_async(self._mark_failed)(batch, e, retry_after=e.retry_after)
+        except BadRequest as e:
+            if len(batch) == 1:
+                await sync_to_async(self._mark_failed)(batch, e, permanent=True)
+                return 0
+            # まとめた中の1件が原因の可能性があるため、1件ずつ送り直して原因の通知のみ失敗とする
+            sent = 0
+            for notification in batch:
+                sent += await self._send_batch(
+                    chat_id, [notification], notification.message[:MAX_MESSAGE_LENGTH]
+                )
+            return sent
+        except Forbidden as e:
+            # ブロックされた等は再送しても成功しない
+            await sync_to_async(self._mark_failed)(batch, e, permanent=True)
+        except Exception as e:
+            await sync_to_async(self._mark_failed)(batch, e)
+        else:
+            await sync_to_async(self._mark_sent)(batch)
+            return len(batch)
+        return 0
+
+    async def run(self, interval: float):
+        """送信待ちがなくなったらinterval秒待機しながら送信を続ける"""
+        while True:
+            if not await self.drain():
+                await asyncio.sleep(interval)
+
+    @staticmethod
+    def _coalesce(notifications):
+        """1メッセージに収まる範囲で通知をまとめる"""
+        batch = [notifications[0]]
+        text = notifications[0].message[:MAX_MESSAGE_LENGTH]
+        for notification in notifications[1:]:
+            combined = f"{text}\n\n{notification.message}"
+            if len(combined) > MAX_MESSAGE_LENGTH:
+                break
+            batch.append(notification)
+            text = combined
+        return batch, text
+
+    @staticmethod
+    @transaction.atomic
+    def _claim_due():
+        """送信時刻になった通知を取得し、他のワーカーが取得しないよう確保する"""
+        now = timezone.now()
+        notifications = list(
+            Notification.objects.select_for_update(skip_locked=True).filter(
+                status='pending',
+                next_attempt_at__lte=now
+            ).order_by('id')[:settings.NOTIFICATION_BATCH_SIZE]
+        )
+        Notification.objects.filter(pk__in=[n.pk for n in notifications]).update(
+            next_attempt_at=now + timedelta(seconds=settings.NOTIFICATION_CLAIM_TIMEOUT)
+        )
+        return notifications
+
+    @staticmethod
+    def _release(notifications):
+        Notification.objects.filter(pk__in=[n.pk for n in notifications]).update(
+            next_attempt_at=timezone.now()
+        )
+
+    @staticmethod
+    def _mark_sent(batch):
+        Notification.objects.filter(pk__in=[n.pk for n in batch]).update(
+            status='sent',
+            attempts=F('attempts') + 1,
+            sent_at=timezone.now(),
+            updated_at=timezone.now()
+        )
+
+    @staticmethod
+    def _mark_failed(batch, error, retry_after=None, permanent=False):
+        now = timezone.now()
+        for notification in batch:
+            notification.attempts += 1
+            notification.last_error = str(error)
+            notification.updated_at = now
+            if permanent or notification.attempts >= settings.NOTIFICATION_MAX_ATTEMPTS:
+                notification.status = 'failed'
+            else:
+                delay = retry_after or settings.NOTIFICATION_RETRY_DELAY * 2 ** (notification.attempts - 1)
+                notification.next_attempt_at = now + timedelta(seconds=delay)
+        Notification.objects.bulk_update(
+            batch, ['attempts', 'last_error', 'status', 'next_attempt_at', 'updated_at']
+        )
+        logger.warning(f"通知送信エラー (chat_id={batch[0].chat_id}): {error}")
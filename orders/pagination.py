@@ -0,0 +1,145 @@
+"""
+一覧APIのカーソル（キーセット）ページネーション
+
+ページ番号方式のようにCOUNT(*)やOFFSETによる読み飛ばしを行わず、前ページ末尾の
+（日時, id）より後ろの行を同じ列の複合インデックスで直接取得するため、履歴が
+増えても深いページの取得コストは先頭ページと変わらない。
+"""
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    （日時, id）の新しい順のカーソルページネーション
+
+    サブクラスでorderingに(日時の列, id)を降順で指定する。
+    レスポンスはCursorPaginationと同じくnext・previous・resultsを返す。
+    """
+    ordering = ()
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    invalid_cursor_message = 'カーソルが不正です'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.field = self.ordering[0].lstrip('-')
+        position, reverse = self.decode_cursor(queryset, request)
+
+        # 前のページへ戻る場合は逆順に取得してから並べ直す
+        ordering = self.ordering
+        if reverse:
+            ordering = [name.lstrip('-') if name.startswith('-') else f'-{name}' for name in ordering]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            value, pk = position
+            lookup = 'gt' if reverse else 'lt'
+            # 範囲条件を先に付けてインデックスの走査範囲を限定する
+            queryset = queryset.filter(**{f'{self.field}__{lookup}e': value}).filter(
+                Q(**{f'{self.field}__{lookup}': value})
+                | Q(**{self.field: value, f'pk__{lookup}': pk})
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def decode_cursor(self, queryset, request):
+        """カーソルから((日時, id), 逆方向か)を取り出す"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            tokens = parse.parse_qs(b64decode(encoded.encode('ascii')).decode('ascii'), strict_parsing=True)
+            field = queryset.model._meta.get_field(self.field)
+            value = field.to_python(tokens['p'][0])
+            pk = int(tokens['i'][0])
+            reverse = tokens.get('r', ['0'])[0] == '1'
+        except (KeyError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return (value, pk), reverse
+
+    def encode_cursor(self, instance, reverse: bool) -> str:
+        value = getattr(instance, self.field)
+        tokens = {'p': value.isoformat(), 'i': instance.pk}
+        if reverse:
+            tokens['r'] = '1'
+        encoded = b64encode(parse.urlencode(tokens, doseq=True).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class OrderPagination(KeysetPagination):
+    ordering = ('-ordered_at', '-id')
+
+
+class SessionPagination(KeysetPagination):
+    ordering = ('-started_at', '-id')
+
+
+class PaymentPagination(KeysetPagination):
+    ordering = ('-requested_at', '-id')
+
+
+class StaffCallPagination(KeysetPagination):
+    ordering = ('-called_at', '-id')
@@ -0,0 +1,66 @@
+"""
+テーブルQRコード用の署名付きトークン
+
+トークンは「テーブルID.店舗ID.エポック.署名」を36進数とbase64urlで詰めた短い文字列で、
+署名をHMACで検証するためDBを参照せずに改ざん・偽造を判定できる。
+店舗のqr_epochを進めると、それ以前に発行したトークンはすべて無効になる。
+"""
+from typing import NamedTuple, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.http import base36_to_int, int_to_base36, urlsafe_base64_encode
+
+KEY_SALT = 'orders.qr_tokens'
+
+# QRコードURL内でトークンを渡すクエリパラメータ名
+QR_TOKEN_PARAM = 't'
+
+# 署名の長さ（バイト）。base64urlで12文字
+SIGNATURE_BYTES = 9
+
+
+class QRToken(NamedTuple):
+    """検証済みトークンの内容"""
+    table_id: int
+    store_id: int
+    epoch: int
+
+
+def _signature(payload: str) -> str:
+    digest = salted_hmac(
+        KEY_SALT, payload, secret=settings.QR_TOKEN_SECRET, algorithm='sha256'
+    ).digest()
+    return urlsafe_base64_encode(digest[:SIGNATURE_BYTES])
+
+
+def make_qr_token(table_id: int, store_id: int, epoch: int) -> str:
+    """テーブル用の署名付きトークンを生成"""
+    payload = '.'.join(int_to_base36(value) for value in (table_id, store_id, epoch))
+    return f'{payload}.{_signature(payload)}'
+
+
+def verify_qr_token(token: str) -> Optional[QRToken]:
+    """署名を検証してトークンの内容を返す（不正な場合はNone）"""
+    payload, _, signature = token.rpartition('.')
+    parts = payload.split('.')
+    if len(parts) != 3 or not constant_time_compare(signature, _signature(payload)):
+        return None
+    try:
+        return QRToken(*(base36_to_int(part) for part in parts))
+    except ValueError:
+        return None
+
+
+def extract_qr_token(value: str) -> str:
+    """QRコードURLからトークンを取り出す（トークン単体が渡された場合はそのまま返す）"""
+    if '?' not in value:
+        return value
+    return parse_qs(urlsplit(value).query).get(QR_TOKEN_PARAM, [''])[0]
+
+
+def build_qr_code_url(table_id: int, store_id: int, epoch: int) -> str:
+    """QRコードに埋め込むMini AppのURL"""
+    token = make_qr_token(table_id, store_id, epoch)
+    return f"{settings.TELEGRAM_WEBHOOK_URL}/miniapp/?{QR_TOKEN_PARAM}={token}"
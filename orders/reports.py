@@ -0,0 +1,227 @@
+"""
+売上集計（時間帯別ロールアップ）
+
+注文が提供済みになった時点・会計が支払済みになった時点で、店舗×時間帯の集計行を
+F式で加算する。売上レポートは注文・明細を走査せず集計行だけから求める。
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import Coalesce, TruncDate, TruncHour
+from django.utils import timezone
+
+from .models import Order, OrderItem, Payment, SalesHourly, SalesHourlyItem
+
+
+def hour_bucket(value: datetime.datetime) -> datetime.datetime:
+    """集計する時間帯（現地時刻の時単位に切り捨て）"""
+    return timezone.localtime(value).replace(minute=0, second=0, microsecond=0)
+
+
+def local_date_range(date_from: datetime.date, date_to: datetime.date):
+    """現地時刻の日付範囲（両端を含む）を[開始, 終了)の日時に変換"""
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.datetime.combine(date_from, datetime.time.min), tz)
+    end = timezone.make_aware(
+        datetime.datetime.combine(date_to + datetime.timedelta(days=1), datetime.time.min), tz
+    )
+    return start, end
+
+
+def _increment(model, keys: dict, deltas: dict, defaults=None):
+    """集計行に加算（行がなければ作成）"""
+    updates = {field: F(field) + value for field, value in deltas.items()}
+    updates['updated_at'] = timezone.now()
+    if model.objects.filter(**keys).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **(defaults or {}), **deltas)
+    except IntegrityError:
+        # 同時に別のリクエストが行を作成した
+        model.objects.filter(**keys).update(**updates)
+
+
+def rollup_order_status(order: Order, previous_status: str):
+    """注文の提供済みへの遷移（提供済みからの取り消し）を集計に反映"""
+    was_served = previous_status == 'served'
+    is_served = order.status == 'served'
+    if was_served == is_served:
+        return
+    sign = 1 if is_served else -1
+    store_id = order.session.store_id
+    hour = hour_bucket(order.ordered_at)
+
+    _increment(SalesHourly, {'store_id': store_id, 'hour': hour}, {'order_count': sign})
+
+    items = defaultdict(lambda: {'quantity': 0, 'revenue': Decimal('0.00')})
+    names = {}
+    for item in order.items.all():
+        items[item.menu_item_id]['quantity'] += item.quantity
+        items[item.menu_item_id]['revenue'] += item.subtotal
+        names[item.menu_item_id] = item.menu_item_name
+    for menu_item_id, totals in items.items():
+        _increment(
+            SalesHourlyItem,
+            {'store_id': store_id, 'hour': hour, 'menu_item_id': menu_item_id},
+            {
+                'quantity': sign * totals['quantity'],
+                'revenue': sign * totals['revenue'],
+                'order_count': sign,
+            },
+            defaults={'menu_item_name': names[menu_item_id]}
+        )
+
+
+def rollup_payment_status(payment: Payment, previous_status: str):
+    """会計の支払済みへの遷移（支払済みからの取り消し）を集計に反映"""
+    was_paid = previous_status == 'paid'
+    is_paid = payment.status == 'paid'
+    if was_paid == is_paid or not payment.paid_at:
+        return
+    sign = 1 if is_paid else -1
+    session = payment.session
+    _increment(
+        SalesHourly,
+        {'store_id': session.store_id, 'hour': hour_bucket(payment.paid_at)},
+        {
+            'revenue': sign * payment.total_amount,
+            'payment_count': sign,
+            'guest_count': sign * session.party_size,
+        }
+    )
+
+
+def rebuild_rollups(store_id=None):
+    """
+    注文・会計から集計行を作り直す
+
+    Returns:
+        (時間帯別の行数, 時間帯別商品の行数)
+    """
+    tz = timezone.get_current_timezone()
+    orders = Order.objects.filter(status='served')
+    payments = Payment.objects.filter(status='paid', paid_at__isnull=False)
+    items = OrderItem.objects.filter(order__status='served')
+    if store_id:
+        orders = orders.filter(session__store_id=store_id)
+        payments = payments.filter(session__store_id=store_id)
+        items = items.filter(order__session__store_id=store_id)
+
+    hourly = defaultdict(dict)
+    for row in orders.annotate(
+        hour=TruncHour('ordered_at', tzinfo=tz)
+    ).values('session__store_id', 'hour').annotate(order_count=Count('id')).order_by():
+        hourly[row['session__store_id'], row['hour']]['order_count'] = row['order_count']
+    for row in payments.annotate(
+        hour=TruncHour('paid_at', tzinfo=tz)
+    ).values('session__store_id', 'hour').annotate(
+        revenue=Sum('total_amount'),
+        payment_count=Count('id'),
+        guest_count=Sum('session__party_size')
+    ).order_by():
+        hourly[row['session__store_id'], row['hour']].update(
+            revenue=row['revenue'],
+            payment_count=row['payment_count'],
+            guest_count=row['guest_count']
+        )
+
+    item_rows = items.annotate(
+        hour=TruncHour('order__ordered_at', tzinfo=tz)
+    ).values('order__session__store_id', 'hour', 'menu_item_id').annotate(
+        name=Max('menu_item_name'),
+        total_quantity=Sum('quantity'),
+        total_revenue=Sum('subtotal'),
+        orders=Count('order', distinct=True)
+    ).order_by()
+
+    with transaction.atomic():
+        targets = (SalesHourly.objects.all(), SalesHourlyItem.objects.all())
+        for queryset in targets:
+            (queryset.filter(store_id=store_id) if store_id else queryset).delete()
+        SalesHourly.objects.bulk_create(
+            [
+                SalesHourly(store_id=key[0], hour=key[1], **values)
+                for key, values in hourly.items()
+            ],
+            batch_size=500
+        )
+        item_rollups = SalesHourlyItem.objects.bulk_create(
+            [
+                SalesHourlyItem(
+                    store_id=row['order__session__store_id'],
+                    hour=row['hour'],
+                    menu_item_id=row['menu_item_id'],
+                    menu_item_name=row['name'],
+                    quantity=row['total_quantity'],
+                    revenue=row['total_revenue'],
+                    order_count=row['orders']
+                )
+                for row in item_rows
+            ],
+            batch_size=500
+        )
+    return len(hourly), len(item_rollups)
+
+
+def _strip_prefix(row: dict) -> dict:
+    return {key.removeprefix('total_'): value for key, value in row.items()}
+
+
+def sales_report(store_id, date_from: datetime.date, date_to: datetime.date,
+                 group_by: str = 'day', limit: int = 10) -> dict:
+    """
+    期間（両端を含む日付）の売上レポート
+
+    Args:
+        group_by: 推移の集計単位（'day' または 'hour'）
+        limit: 人気商品の件数
+    """
+    tz = timezone.get_current_timezone()
+    start, end = local_date_range(date_from, date_to)
+    hourly = SalesHourly.objects.filter(store_id=store_id, hour__gte=start, hour__lt=end)
+    # 集計名がモデルのフィールド名と衝突しないよう接頭辞を付けて集計する
+    totals = {
+        'total_revenue': Coalesce(Sum('revenue'), Decimal('0.00')),
+        'total_order_count': Coalesce(Sum('order_count'), 0),
+        'total_payment_count': Coalesce(Sum('payment_count'), 0),
+        'total_guest_count': Coalesce(Sum('guest_count'), 0),
+    }
+
+    summary = _strip_prefix(hourly.aggregate(**totals))
+    # 売上は会計済みの会計の合計のため、会計数で割った会計あたりの平均額とする
+    summary['average_payment_amount'] = (
+        (summary['revenue'] / summary['payment_count']).quantize(Decimal('1'))
+        if summary['payment_count'] else Decimal('0')
+    )
+
+    period = TruncDate('hour', tzinfo=tz) if group_by == 'day' else F('hour')
+    series = [
+        _strip_prefix(row)
+        for row in hourly.annotate(period=period).values('period').annotate(**totals).order_by('period')
+    ]
+
+    top_items = [
+        _strip_prefix(row)
+        for row in SalesHourlyItem.objects.filter(
+            store_id=store_id, hour__gte=start, hour__lt=end
+        ).values('menu_item').annotate(
+            total_menu_item_name=Max('menu_item_name'),
+            total_quantity=Sum('quantity'),
+            total_revenue=Sum('revenue'),
+            total_order_count=Sum('order_count')
+        ).filter(total_quantity__gt=0).order_by('-total_quantity', '-total_revenue')[:limit]
+    ]
+
+    return {
+        'store_id': int(store_id),
+        'date_from': date_from,
+        'date_to': date_to,
+        'group_by': group_by,
+        'summary': summary,
+        'series': series,
+        'top_items': top_items,
+    }
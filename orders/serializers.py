@@ -1,9 +1,17 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from .models import (
     Store, Table, Category, MenuItem, MenuItemImage,
     Session, Order, OrderItem, StaffCall, Payment, User
 )
+from .table_index import table_index
+from .images import media_url
+from .notifications import (
+    enqueue_notification, order_created_message, staff_call_message
+)
 from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 
 
@@ -26,12 +34,43 @@ class CategorySerializer(serializers.ModelSerializer):
 
 
 class MenuItemImageSerializer(serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+    fallback_url = serializers.SerializerMethodField()
+
     class Meta:
         model = MenuItemImage
         fields = '__all__'
 
+    def get_url(self, obj):
+        return media_url(obj.file_path)
+
+    def get_fallback_url(self, obj):
+        return media_url(obj.fallback_path)
+
+
+class FieldProjectionMixin:
+    """?fields=id,name,priceのように指定されたフィールドのみを出力する（参照系のリクエストのみ）"""
 
-class MenuItemSerializer(serializers.ModelSerializer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            # 更新時に絞り込むと送信された値が無視されるため適用しない
+            return
+        requested = request.query_params.get('fields')
+        if not requested:
+            return
+        names = {name.strip() for name in requested.split(',') if name.strip()}
+        unknown = names - set(self.fields)
+        if unknown:
+            raise serializers.ValidationError({
+                'fields': f"不明なフィールドです: {', '.join(sorted(unknown))}"
+            })
+        for name in set(self.fields) - names:
+            self.fields.pop(name)
+
+
+class MenuItemSerializer(FieldProjectionMixin, serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     images = MenuItemImageSerializer(many=True, read_only=True, source='menuitemimage_set')
     
@@ -40,7 +79,7 @@ class MenuItemSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class MenuItemListSerializer(serializers.ModelSerializer):
+class MenuItemListSerializer(FieldProjectionMixin, serializers.ModelSerializer):
     """メニュー一覧用の軽量シリアライザ"""
     category_name = serializers.CharField(source='category.name', read_only=True)
     thumbnail_url = serializers.SerializerMethodField()
@@ -54,9 +93,35 @@ class MenuItemListSerializer(serializers.ModelSerializer):
         ]
     
     def get_thumbnail_url(self, obj):
-        if obj.image_thumbnail_path:
-            return obj.image_thumbnail_path
-        return None
+        return media_url(obj.image_thumbnail_path)
+
+
+# 列指向形式でカテゴリ表に移す列（メニュー一覧の列名: カテゴリ表の列名）
+CATEGORY_COLUMNS = {'category_id': 'id', 'category_name': 'name'}
+
+
+def compact_menu(rows, columns) -> dict:
+    """
+    メニュー一覧を列指向の形式に変換
+
+    キーを項目ごとに繰り返さないよう、各項目はcolumnsの順に値を並べた配列にする。
+    カテゴリはcategoriesに1回だけ列挙し、項目からはcategory列の添字で参照する。
+    """
+    category_columns = [column for column in columns if column in CATEGORY_COLUMNS]
+    item_columns = [column for column in columns if column not in CATEGORY_COLUMNS]
+    categories, positions, items = [], {}, []
+    for row in rows:
+        values = [row[column] for column in item_columns]
+        if category_columns:
+            key = tuple(row[column] for column in category_columns)
+            if key not in positions:
+                positions[key] = len(categories)
+                categories.append({CATEGORY_COLUMNS[column]: row[column] for column in category_columns})
+            values.append(positions[key])
+        items.append(values)
+    if category_columns:
+        item_columns.append('category')
+    return {'categories': categories, 'columns': item_columns, 'items': items}
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -97,78 +162,75 @@ class OrderCreateSerializer(serializers.Serializer):
         return value
     
     def validate(self, data):
-        # セッションの存在確認
+        # セッションの存在確認（レスポンスのテーブル番号用にテーブルも取得）
         try:
-            session = Session.objects.get(session_code=data['session_code'])
+            session = Session.objects.select_related('table').get(session_code=data['session_code'])
             if session.status not in ['active', 'payment_requested']:
                 raise serializers.ValidationError("このセッションは注文できません")
             data['session'] = session
         except Session.DoesNotExist:
             raise serializers.ValidationError("セッションが見つかりません")
         
-        # メニュー項目の検証
+        # メニュー項目の検証（カート内の全商品を1クエリで取得）
+        menu_items = MenuItem.objects.filter(
+            store_id=session.store_id, is_active=True
+        ).in_bulk(
+            [item_data['menu_item_id'] for item_data in data['items']]
+        )
         total_amount = Decimal('0.00')
         validated_items = []
         
         for item_data in data['items']:
-            try:
-                menu_item = MenuItem.objects.get(
-                    id=item_data['menu_item_id'],
-                    is_active=True
-                )
-                
-                if not menu_item.is_available:
-                    raise serializers.ValidationError(
-                        f"{menu_item.name} は現在提供できません"
-                    )
-                
-                max_qty = menu_item.max_quantity_per_order or 10
-                if item_data['quantity'] > max_qty:
-                    raise serializers.ValidationError(
-                        f"{menu_item.name} は1注文あたり{max_qty}個までです"
-                    )
-                
-                subtotal = menu_item.price * item_data['quantity']
-                total_amount += subtotal
-                
-                validated_items.append({
-                    'menu_item': menu_item,
-                    'quantity': item_data['quantity'],
-                    'note': item_data.get('note', ''),
-                    'subtotal': subtotal
-                })
-                
-            except MenuItem.DoesNotExist:
+            menu_item = menu_items.get(item_data['menu_item_id'])
+            if menu_item is None:
                 raise serializers.ValidationError(
                     f"メニュー項目(ID:{item_data['menu_item_id']})が見つかりません"
                 )
+            
+            if not menu_item.is_available:
+                raise serializers.ValidationError(
+                    f"{menu_item.name} は現在提供できません"
+                )
+            
+            max_qty = menu_item.max_quantity_per_order or 10
+            if item_data['quantity'] > max_qty:
+                raise serializers.ValidationError(
+                    f"{menu_item.name} は1注文あたり{max_qty}個までです"
+                )
+            
+            subtotal = menu_item.price * item_data['quantity']
+            total_amount += subtotal
+            
+            validated_items.append({
+                'menu_item': menu_item,
+                'quantity': item_data['quantity'],
+                'note': item_data.get('note', ''),
+                'subtotal': subtotal
+            })
         
         data['validated_items'] = validated_items
         data['total_amount'] = total_amount
         
         return data
     
+    @transaction.atomic
     def create(self, validated_data):
         session = validated_data['session']
         
-        # 注文番号を生成（セッション内での連番）
-        last_order = Order.objects.filter(session=session).order_by('-order_number').first()
-        order_number = (last_order.order_number + 1) if last_order else 1
-        
-        # 注文を作成
+        # 注文を作成（注文番号はセッション内での連番）
         order = Order.objects.create(
             session=session,
             telegram_user_id=validated_data.get('telegram_user_id', ''),
             telegram_username=validated_data.get('telegram_username', ''),
-            order_number=order_number,
+            order_number=session.allocate_order_number(),
             total_amount=validated_data['total_amount'],
             status='pending',
             ordered_at=timezone.now()
         )
         
-        # 注文明細を作成
-        for item_data in validated_data['validated_items']:
-            OrderItem.objects.create(
+        # 注文明細を一括作成
+        items = OrderItem.objects.bulk_create([
+            OrderItem(
                 order=order,
                 menu_item=item_data['menu_item'],
                 menu_item_name=item_data['menu_item'].name,
@@ -178,6 +240,16 @@ class OrderCreateSerializer(serializers.Serializer):
                 note=item_data['note'],
                 status='pending'
             )
+            for item_data in validated_data['validated_items']
+        ])
+        
+        session.add_to_totals(
+            order.total_amount,
+            1,
+            sum(item.quantity for item in items)
+        )
+        
+        enqueue_notification(session.telegram_chat_id, order_created_message(order, items))
         
         return order
 
@@ -191,10 +263,24 @@ class SessionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Session
         fields = '__all__'
-        read_only_fields = ['created_at', 'updated_at', 'started_at', 'session_code']
+        read_only_fields = [
+            'created_at', 'updated_at', 'started_at', 'session_code',
+            'next_order_number', 'subtotal_amount', 'order_count', 'item_count'
+        ]
     
     def get_total_amount(self, obj):
-        return sum(order.total_amount for order in obj.order_set.exclude(status='cancelled'))
+        return obj.subtotal_amount
+
+
+class MiniAppSessionSerializer(serializers.ModelSerializer):
+    """Mini App起動データ用のセッション（注文明細を含まない）"""
+
+    class Meta:
+        model = Session
+        fields = [
+            'id', 'session_code', 'party_size', 'status',
+            'subtotal_amount', 'order_count', 'item_count', 'started_at'
+        ]
 
 
 class SessionCreateSerializer(serializers.Serializer):
@@ -204,18 +290,18 @@ class SessionCreateSerializer(serializers.Serializer):
     telegram_chat_id = serializers.CharField(max_length=50, required=False, allow_blank=True)
     
     def validate(self, data):
-        # テーブルの存在確認
-        try:
-            table = Table.objects.get(qr_code_url=data['qr_code_url'], is_available=True)
-            data['table'] = table
-        except Table.DoesNotExist:
+        # テーブルの存在確認（プロセス内インデックスで解決）
+        entry = table_index.get(data['qr_code_url'])
+        if entry is None or not entry.is_available:
             raise serializers.ValidationError("有効なテーブルが見つかりません")
+        table = entry.to_table()
+        data['table'] = table
         
         # アクティブなセッションが既に存在するか確認
         existing_session = Session.objects.filter(
-            table=table,
-            status__in=['active', 'calling_staff', 'payment_requested']
-        ).first()
+            table_id=entry.table_id,
+            status__in=Session.ACTIVE_STATUSES
+        ).select_related('store', 'table').order_by('-started_at', '-id').first()
         
         if existing_session:
             data['existing_session'] = existing_session
@@ -231,7 +317,7 @@ class SessionCreateSerializer(serializers.Serializer):
         session_code = f"TBL{table.id}-{timezone.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:6].upper()}"
         
         session = Session.objects.create(
-            store=table.store,
+            store_id=table.store_id,
             table=table,
             session_code=session_code,
             party_size=validated_data['party_size'],
@@ -260,7 +346,7 @@ class StaffCallCreateSerializer(serializers.Serializer):
     
     def validate(self, data):
         try:
-            session = Session.objects.get(session_code=data['session_code'])
+            session = Session.objects.select_related('table').get(session_code=data['session_code'])
             if session.status not in ['active', 'payment_requested']:
                 raise serializers.ValidationError("このセッションからは呼び出しできません")
             data['session'] = session
@@ -269,6 +355,7 @@ class StaffCallCreateSerializer(serializers.Serializer):
         
         return data
     
+    @transaction.atomic
     def create(self, validated_data):
         staff_call = StaffCall.objects.create(
             session=validated_data['session'],
@@ -280,7 +367,9 @@ class StaffCallCreateSerializer(serializers.Serializer):
         
         # セッションステータスを更新
         validated_data['session'].status = 'calling_staff'
-        validated_data['session'].save()
+        validated_data['session'].save(update_fields=['status', 'updated_at'])
+        
+        enqueue_notification(settings.TELEGRAM_STAFF_CHAT_ID, staff_call_message(staff_call))
         
         return staff_call
 
@@ -321,12 +410,6 @@ class PaymentRequestSerializer(serializers.Serializer):
     def create(self, validated_data):
         session = validated_data['session']
         
-        # 合計金額を計算
-        total_amount = sum(
-            order.total_amount 
-            for order in session.order_set.exclude(status='cancelled')
-        )
-        
         # 既存の会計レコードがあればキャンセル
         if hasattr(session, 'payment'):
             session.payment.status = 'cancelled'
@@ -335,14 +418,14 @@ class PaymentRequestSerializer(serializers.Serializer):
         # 新しい会計レコードを作成
         payment = Payment.objects.create(
             session=session,
-            total_amount=total_amount,
+            total_amount=session.subtotal_amount,
             status='pending',
             requested_at=timezone.now()
         )
         
         # セッションステータスを更新
         session.status = 'payment_requested'
-        session.save()
+        session.save(update_fields=['status', 'updated_at'])
         
         return payment
 
@@ -0,0 +1,57 @@
+"""
+モデルのシグナルハンドラー
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Store, Category, MenuItem, MenuItemImage, Table
+from .caching import bump_menu_version, bump_table_index_version
+
+
+@receiver([post_save, post_delete], sender=MenuItem)
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_menu_cache(sender, instance, **kwargs):
+    """メニュー・カテゴリ変更時にメニューキャッシュを無効化"""
+    bump_menu_version(instance.store_id)
+
+
+@receiver([post_save, post_delete], sender=MenuItemImage)
+def invalidate_menu_cache_for_image(sender, instance, **kwargs):
+    """メニュー画像変更時にメニューキャッシュを無効化"""
+    store_id = MenuItem.objects.filter(
+        pk=instance.menu_item_id
+    ).values_list('store_id', flat=True).first()
+    # メニュー項目ごと削除された場合はMenuItem側のシグナルで無効化される
+    if store_id is not None:
+        bump_menu_version(store_id)
+
+
+@receiver(post_save, sender=Store)
+def invalidate_menu_cache_for_store(sender, instance, **kwargs):
+    """店舗情報の変更時にメニューキャッシュ（Mini App起動データの店舗情報）を無効化"""
+    bump_menu_version(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Table)
+@receiver([post_save, post_delete], sender=Store)
+def invalidate_table_index(sender, instance, **kwargs):
+    """テーブル・店舗（QRコード世代）変更時にQRコード→テーブルインデックスを無効化"""
+    bump_table_index_version()
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    SQLite接続の初期設定
+
+    WALでは読み込みと書き込みが互いをブロックしないため、注文の書き込み中も
+    メニュー・ダッシュボードの読み込みを待たせない。WALではfsyncをチェックポイント時に
+    まとめられるため、synchronousはNORMALで十分な耐久性がある。
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"PRAGMA journal_mode={getattr(settings, 'SQLITE_JOURNAL_MODE', 'WAL')}")
+        cursor.execute('PRAGMA synchronous=NORMAL')
@@ -0,0 +1,155 @@
+"""
+QRコード→テーブル解決用のプロセス内インデックス
+
+QRスキャンのたびにqr_code_url列を検索しないよう、QRコードとテーブルの対応を
+プロセスのメモリに保持する。テーブル・店舗が更新されると共有キャッシュ上の
+バージョンが進み、各プロセスは次回の参照時にインデックスを破棄する。
+キャッシュがプロセスごと（LocMemCache）の場合は他のワーカーに更新が伝わらないため、
+各エントリはTABLE_INDEX_TTL秒でDBから読み込み直す。
+
+QRコードに署名付きトークンが含まれる場合は署名を検証してからテーブルIDで読み込み、
+トークンでない（従来形式の）QRコードはqr_code_urlの文字列で検索する。
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+from .caching import get_table_index_version
+from .models import Table
+from .qr_tokens import extract_qr_token, verify_qr_token
+
+logger = logging.getLogger(__name__)
+
+TABLE_FIELDS = [field.attname for field in Table._meta.concrete_fields]
+
+
+class TableEntry(NamedTuple):
+    """インデックスに保持するテーブル情報"""
+    table_id: int
+    store_id: int
+    is_available: bool
+    values: tuple
+
+    def to_table(self) -> Table:
+        """DBを参照せずにTableインスタンスを復元"""
+        return Table.from_db('default', TABLE_FIELDS, self.values)
+
+
+def _entry(values: tuple) -> TableEntry:
+    row = dict(zip(TABLE_FIELDS, values))
+    return TableEntry(row['id'], row['store_id'], row['is_available'], values)
+
+
+class TableIndex:
+    """件数上限付き（LRU）のQRコード→テーブルインデックス"""
+
+    def __init__(self, maxsize: int, ttl: float = 60, clock=time.monotonic):
+        """
+        Args:
+            ttl: エントリをDBから読み込み直すまでの秒数
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        # QRコード → (TableEntry, 有効期限)
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _sync_version(self):
+        version = get_table_index_version()
+        if version != self._version:
+            with self._lock:
+                self._entries.clear()
+                self._version = version
+
+    def _put(self, qr_code_url: str, entry: TableEntry):
+        with self._lock:
+            self._entries[qr_code_url] = (entry, self.clock() + self.ttl)
+            self._entries.move_to_end(qr_code_url)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get(self, qr_code_url: str) -> Optional[TableEntry]:
+        """
+        QRコード（URLまたはトークン）に対応するテーブルを取得
+
+        利用不可のテーブルもそのまま返すため、呼び出し側でis_availableを確認する。
+        """
+        self._sync_version()
+        with self._lock:
+            cached = self._entries.get(qr_code_url)
+            if cached is not None:
+                entry, expires_at = cached
+                if expires_at > self.clock():
+                    self._entries.move_to_end(qr_code_url)
+                    return entry
+                # 期限切れ（無効化されたトークン・利用不可になったテーブルを反映するため読み込み直す）
+                del self._entries[qr_code_url]
+
+        token = verify_qr_token(extract_qr_token(qr_code_url))
+        if token is not None:
+            # 店舗のQRコード世代が進んでいれば古いトークンとして扱う
+            tables = Table.objects.filter(
+                id=token.table_id,
+                store_id=token.store_id,
+                store__qr_epoch=token.epoch
+            )
+        else:
+            tables = Table.objects.filter(qr_code_url=qr_code_url)
+        values = tables.values_list(*TABLE_FIELDS).first()
+        if values is None:
+            # 存在しないQRコードは登録しない（不正なURLでインデックスを溢れさせない）
+            return None
+        entry = _entry(values)
+        self._put(qr_code_url, entry)
+        return entry
+
+    def warm(self) -> int:
+        """利用可能なテーブルを上限件数まで読み込む"""
+        self._sync_version()
+        rows = Table.objects.filter(
+            is_available=True
+        ).order_by('id').values_list(*TABLE_FIELDS)[:self.maxsize]
+        qr_index = TABLE_FIELDS.index('qr_code_url')
+        count = 0
+        for values in rows:
+            self._put(values[qr_index], _entry(values))
+            count += 1
+        logger.info(f"テーブルインデックスを{count}件読み込みました")
+        return count
+
+    def clear(self):
+        """インデックスを破棄"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# グローバルインスタンス
+table_index = TableIndex(
+    getattr(settings, 'TABLE_INDEX_SIZE', 10000),
+    ttl=getattr(settings, 'TABLE_INDEX_TTL', 60)
+)
+
+
+def warm_table_index():
+    """
+    起動時にインデックスを読み込む
+
+    DBに接続できない場合も起動は続行し、参照時に読み込む。ワーカーを
+    フォークするサーバーで接続を共有しないよう、読み込み後に接続を閉じる。
+    """
+    try:
+        table_index.warm()
+    except DatabaseError as e:
+        logger.warning(f"テーブルインデックスの読み込みに失敗しました: {e}")
+    finally:
+        connections.close_all()
@@ -3,7 +3,9 @@ Telegram Bot機能
 """
 import os
 import json
+import asyncio
 import logging
+import threading
 from typing import Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
 from telegram.ext import (
@@ -14,11 +16,13 @@ from telegram.ext import (
     MessageHandler,
     filters
 )
+from telegram.request import HTTPXRequest
 from django.conf import settings
+from django.db import close_old_connections
 from django.urls import reverse
 from asgiref.sync import sync_to_async
 
-from .models import Session, Table, Store, StaffCall
+from .models import Session, Order, Table, Store, StaffCall
 
 logger = logging.getLogger(__name__)
 
@@ -30,27 +34,61 @@ class TelegramBot:
         self.token = settings.TELEGRAM_BOT_TOKEN
         self.webhook_url = settings.TELEGRAM_WEBHOOK_URL
         self.app = None
+        self._init_lock = None
     
     async def initialize(self):
-        """Botアプリケーションの初期化"""
-        self.app = Application.builder().token(self.token).build()
+        """
+        Botアプリケーションの初期化（初回のみ実行）
         
-        # コマンドハンドラー登録
-        self.app.add_handler(CommandHandler("start", self.cmd_start))
-        self.app.add_handler(CommandHandler("help", self.cmd_help))
-        self.app.add_handler(CommandHandler("menu", self.cmd_menu))
-        self.app.add_handler(CommandHandler("order", self.cmd_order))
-        self.app.add_handler(CommandHandler("status", self.cmd_status))
+        HTTPコネクションプールを保持したまま使い回すため、アプリケーションは
+        最初に初期化したイベントループ上でのみ使用すること。
+        """
+        if self.app:
+            return
+        if self._init_lock is None:
+            self._init_lock = asyncio.Lock()
         
-        # コールバックハンドラー登録
-        self.app.add_handler(CallbackQueryHandler(self.handle_callback))
+        async with self._init_lock:
+            if self.app:
+                return
+            
+            request = HTTPXRequest(
+                connection_pool_size=settings.TELEGRAM_CONNECTION_POOL_SIZE,
+                connect_timeout=settings.TELEGRAM_CONNECT_TIMEOUT,
+                read_timeout=settings.TELEGRAM_READ_TIMEOUT,
+                write_timeout=settings.TELEGRAM_WRITE_TIMEOUT,
+                pool_timeout=settings.TELEGRAM_POOL_TIMEOUT,
+            )
+            app = Application.builder().token(self.token).request(request).build()
+            
+            # コマンドハンドラー登録
+            app.add_handler(CommandHandler("start", self.cmd_start))
+            app.add_handler(CommandHandler("help", self.cmd_help))
+            app.add_handler(CommandHandler("menu", self.cmd_menu))
+            app.add_handler(CommandHandler("order", self.cmd_order))
+            app.add_handler(CommandHandler("status", self.cmd_status))
+            
+            # コールバックハンドラー登録
+            app.add_handler(CallbackQueryHandler(self.handle_callback))
+            
+            await app.initialize()
+            self.app = app
         
         logger.info("Telegram Botアプリケーション初期化完了")
     
+    async def shutdown(self):
+        """Botアプリケーションを終了し、HTTP接続を閉じる"""
+        if not self.app:
+            return
+        
+        app, self.app = self.app, None
+        self._init_lock = None
+        await app.shutdown()
+        logger.info("Telegram Botアプリケーション終了")
+    
     async def set_webhook(self):
         """Webhookの設定"""
-        if not self.app:
-            await self.initialize()
+        await self.initialize()
         
         webhook_url = f"{self.webhook_url}/api/telegram/webhook/"
         await self.app.bot.set_webhook(webhook_url)
@@ -58,16 +96,19 @@ class TelegramBot:
     
     async def delete_webhook(self):
         """Webhookの削除"""
-        if not self.app:
-            await self.initialize()
+        await self.initialize()
         
         await self.app.bot.delete_webhook()
         logger.info("Webhook削除完了")
     
+    async def send_message(self, chat_id: str, text: str):
+        """メッセージ送信（Outboxワーカーから使用。利用者の入力を含むためプレーンテキストで送る）"""
+        await self.initialize()
+        await self.app.bot.send_message(chat_id=chat_id, text=text)
+    
     async def process_update(self, update_data: dict):
         """Webhookからのアップデート処理"""
-        if not self.app:
-            await self.initialize()
+        await self.initialize()
         
         update = Update.de_json(update_data, self.app.bot)
         await self.app.process_update(update)
@@ -199,7 +240,6 @@ class TelegramBot:
         # 注文履歴テキスト生成
         order_text = f"📋 **注文履歴** (テーブル: {session.table.table_number})\n\n"
         
-        total = 0
         for order in orders:
             status_emoji = {
                 'pending': '⏳',
@@ -212,11 +252,8 @@ class TelegramBot:
             order_text += f"{status_emoji} **注文 #{order.order_number}**\n"
             order_text += f"金額: ¥{order.total_amount:,.0f}\n"
             order_text += f"状態: {order.get_status_display()}\n\n"
-            
-            if order.status != 'cancelled':
-                total += order.total_amount
         
-        order_text += f"**合計: ¥{total:,.0f}**"
+        order_text += f"**合計: ¥{session.subtotal_amount:,.0f}**"
         
         await update.message.reply_text(
             order_text,
@@ -284,8 +321,8 @@ class TelegramBot:
         try:
             return Session.objects.filter(
                 telegram_chat_id=telegram_user_id,
-                status__in=['active', 'calling_staff', 'payment_requested']
-            ).select_related('table').first()
+                status__in=Session.ACTIVE_STATUSES
+            ).select_related('table').order_by('-started_at', '-id').first()
         except Session.DoesNotExist:
             return None
     
@@ -303,92 +340,109 @@ class TelegramBot:
         """未提供の注文を取得"""
         return list(
             session.order_set.filter(
-                status__in=['pending', 'cooking', 'ready']
+                status__in=Order.OPEN_STATUSES
             ).order_by('ordered_at')
         )
 
 
-# グローバルインスタンス
-telegram_bot = TelegramBot()
-
-
-async def send_notification(chat_id: str, message: str):
-    """
-    通知メッセージを送信
-    
-    Args:
-        chat_id: TelegramチャットID
-        message: 送信するメッセージ
+class UpdateQueue:
     """
-    if not telegram_bot.app:
-        await telegram_bot.initialize()
-    
-    try:
-        await telegram_bot.app.bot.send_message(
-            chat_id=chat_id,
-            text=message,
-            parse_mode='Markdown'
-        )
-    except Exception as e:
-        logger.error(f"通知送信エラー: {e}")
-
+    Webhookアップデートの処理キュー
 
-async def send_order_notification(order):
+    専用スレッドで常駐するイベントループ上でアップデートを処理する。
+    Webhookリクエストはキューへの投入だけで即座に応答できるため、
+    Bot APIの呼び出しに時間がかかってもTelegramの再送は発生しない。
     """
-    注文通知を送信
     
-    Args:
-        order: Orderモデルインスタンス
-    """
-    session = order.session
-    if not session.telegram_chat_id:
-        return
+    def __init__(self, bot: TelegramBot, maxsize: int, concurrency: int):
+        self.bot = bot
+        self.maxsize = maxsize
+        self.concurrency = concurrency
+        self._loop = None
+        self._semaphore = None
+        self._pending = 0
+        self._lock = threading.Lock()
     
-    items_text = "\n".join([
-        f"• {item.menu_item_name} x{item.quantity}"
-        for item in order.orderitem_set.all()
-    ])
+    def start(self):
+        """処理用スレッドとイベントループを起動（起動済みなら何もしない）"""
+        with self._lock:
+            if self._loop:
+                return
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            threading.Thread(
+                target=self._run,
+                args=(loop, ready),
+                name='telegram-update-queue',
+                daemon=True
+            ).start()
+            ready.wait()
+            self._loop = loop
     
-    message = f"""
-🔔 **新規注文**
-
-テーブル: {session.table.table_number}
-注文番号: #{order.order_number}
-
-{items_text}
-
-合計: ¥{order.total_amount:,.0f}
-"""
+    def _run(self, loop, ready):
+        asyncio.set_event_loop(loop)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        loop.call_soon(ready.set)
+        loop.run_forever()
+        loop.close()
     
-    await send_notification(session.telegram_chat_id, message)
-
-
-async def send_staff_call_notification(staff_call):
-    """
-    店員呼び出し通知を送信
+    def startup(self):
+        """キューを起動し、Botアプリケーションを事前に初期化する（ASGI lifespan startup用）"""
+        self.start()
+        asyncio.run_coroutine_threadsafe(self._warm_up(), self._loop)
     
-    Args:
-        staff_call: StaffCallモデルインスタンス
-    """
-    session = staff_call.session
+    async def _warm_up(self):
+        try:
+            await self.bot.initialize()
+        except Exception:
+            # 初期化に失敗しても最初のアップデート処理時に再試行される
+            logger.exception("Telegram Botアプリケーション初期化エラー")
     
-    reason_text = {
-        'water': '💧 お水',
-        'payment': '💳 会計',
-        'question': '❓ 質問',
-        'complaint': '⚠️ 苦情',
-        'other': '📝 その他'
-    }.get(staff_call.reason, staff_call.reason)
+    def shutdown(self, timeout: float = 10):
+        """Botアプリケーションを終了し、イベントループを停止する"""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if not loop:
+            return
+        
+        try:
+            asyncio.run_coroutine_threadsafe(self.bot.shutdown(), loop).result(timeout)
+        except Exception:
+            logger.exception("Telegram Botアプリケーション終了エラー")
+        loop.call_soon_threadsafe(loop.stop)
+    
+    def submit(self, update_data: dict) -> bool:
+        """
+        アップデートを投入
+        
+        Returns:
+            処理待ちが上限に達している場合はFalse
+        """
+        self.start()
+        with self._lock:
+            if self._pending >= self.maxsize:
+                return False
+            self._pending += 1
+        asyncio.run_coroutine_threadsafe(self._handle(update_data), self._loop)
+        return True
     
-    message = f"""
-🔔 **店員呼び出し**
+    async def _handle(self, update_data: dict):
+        try:
+            async with self._semaphore:
+                await self.bot.process_update(update_data)
+        except Exception:
+            logger.exception("アップデート処理エラー")
+        finally:
+            with self._lock:
+                self._pending -= 1
+            # リクエスト外でDBを使うため、寿命切れの接続をここで破棄する
+            await sync_to_async(close_old_connections)()
 
-テーブル: {session.table.table_number}
-理由: {reason_text}
 
-{staff_call.message if staff_call.message else ''}
-"""
-    
-    # 店舗の通知先チャットIDに送信（設定が必要）
-    # ここでは実装省略
-    logger.info(f"店員呼び出し通知: {message}")
+# グローバルインスタンス
+telegram_bot = TelegramBot()
+update_queue = UpdateQueue(
+    telegram_bot,
+    maxsize=settings.TELEGRAM_UPDATE_QUEUE_SIZE,
+    concurrency=settings.TELEGRAM_UPDATE_CONCURRENCY
+)
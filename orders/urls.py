@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
+from .metrics import metrics_view
 
 router = DefaultRouter()
 router.register(r'stores', views.StoreViewSet)
@@ -13,9 +14,14 @@ router.register(r'order-items', views.OrderItemViewSet)
 router.register(r'staff-calls', views.StaffCallViewSet)
 router.register(r'payments', views.PaymentViewSet)
 router.register(r'users', views.UserViewSet)
+router.register(r'reports', views.ReportViewSet, basename='report')
 
 urlpatterns = [
+    path('api/orders/dashboard/stream/', views.dashboard_stream, name='dashboard-stream'),
     path('api/', include(router.urls)),
+    path('api/exports/<str:kind>/', views.ExportView.as_view(), name='export'),
+    path('api/miniapp/bootstrap/', views.MiniAppBootstrapView.as_view(), name='miniapp-bootstrap'),
     path('api/telegram/webhook/', views.TelegramWebhookView.as_view(), name='telegram-webhook'),
     path('miniapp/', views.miniapp_view, name='miniapp'),
+    path('metrics', metrics_view, name='metrics'),
 ]
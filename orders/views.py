@@ -1,10 +1,16 @@
-from rest_framework import viewsets, status
+from rest_framework import viewsets, status, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.parsers import FormParser, MultiPartParser
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from django.utils import timezone
-from django.db.models import Q, Sum, Count
+from django.utils.dateparse import parse_datetime
+from django.db.models import Q, Sum, Count, Max, Prefetch
 from decimal import Decimal
+import datetime
 
 from .models import (
     Store, Table, Category, MenuItem, MenuItemImage,
@@ -13,13 +19,71 @@ from .models import (
 from .serializers import (
     StoreSerializer, TableSerializer, CategorySerializer,
     MenuItemSerializer, MenuItemListSerializer, MenuItemImageSerializer,
-    SessionSerializer, SessionCreateSerializer,
+    SessionSerializer, SessionCreateSerializer, MiniAppSessionSerializer,
     OrderSerializer, OrderCreateSerializer,
     OrderItemSerializer,
     StaffCallSerializer, StaffCallCreateSerializer,
     PaymentSerializer, PaymentRequestSerializer,
-    UserSerializer
+    UserSerializer, compact_menu
 )
+from .caching import (
+    menu_list_cache_key, store_menu_cache_key, make_etag, etag_matches, menu_cache_timeout
+)
+from .events import dashboard_events, publish_order_event, RESYNC
+from .notifications import enqueue_notification, order_status_message
+from .table_index import table_index
+from .images import InvalidImageError, save_original, schedule_image_processing
+from .compression import allow_brotli
+from .pagination import OrderPagination, PaymentPagination, SessionPagination, StaffCallPagination
+from .reports import rollup_order_status, rollup_payment_status, sales_report
+
+
+def not_modified(etag):
+    """304 Not Modifiedレスポンス"""
+    return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+
+# 調理ダッシュボードの1レスポンスあたりの件数
+DASHBOARD_PAGE_SIZE = 100
+DASHBOARD_MAX_PAGE_SIZE = 500
+
+
+def can_access_store(user, store_id) -> bool:
+    """スタッフが店舗のデータを参照できるか（管理者は全店舗）"""
+    if user.is_superuser or getattr(user, 'role', None) == 'admin':
+        return True
+    return str(getattr(user, 'store_id', None)) == str(store_id)
+
+
+def dashboard_queryset(store_id):
+    """調理ダッシュボード用の店舗の注文"""
+    return Order.objects.filter(
+        session__store_id=store_id
+    ).select_related('session', 'session__table').prefetch_related('items')
+
+
+def encode_dashboard_cursor(order):
+    """ダッシュボード差分取得用カーソル（更新日時,注文ID）"""
+    updated_at = order.updated_at.astimezone(datetime.timezone.utc)
+    return f"{updated_at.strftime('%Y-%m-%dT%H:%M:%S.%fZ')},{order.id}"
+
+
+def parse_dashboard_cursor(value):
+    """カーソルを(更新日時, 注文ID)に変換。不正な値はValueError"""
+    updated_at, _, order_id = value.partition(',')
+    updated_at = parse_datetime(updated_at)
+    if updated_at is None or timezone.is_naive(updated_at):
+        raise ValueError(value)
+    return updated_at, int(order_id or 0)
+
+
+def order_status_delta(order):
+    """ダッシュボード配信用の注文ステータス差分"""
+    return {
+        'id': order.id,
+        'status': order.status,
+        'updated_at': serializers.DateTimeField().to_representation(order.updated_at),
+    }
 
 
 class StoreViewSet(viewsets.ModelViewSet):
@@ -45,15 +109,14 @@ class TableViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            table = Table.objects.get(qr_code_url=qr_code_url, is_available=True)
-            serializer = self.get_serializer(table)
-            return Response(serializer.data)
-        except Table.DoesNotExist:
+        entry = table_index.get(qr_code_url)
+        if entry is None or not entry.is_available:
             return Response(
                 {'error': 'テーブルが見つかりません'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        serializer = self.get_serializer(entry.to_table())
+        return Response(serializer.data)
 
 
 class CategoryViewSet(viewsets.ModelViewSet):
@@ -69,10 +132,19 @@ class CategoryViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(store_id=store_id)
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        """カテゴリ一覧（メニューバージョンをETagに使用）"""
+        etag = make_etag(request, menu_list_cache_key(request, prefix='category_list'))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        return allow_brotli(response)
+
 
 class MenuItemViewSet(viewsets.ModelViewSet):
     """メニュー項目API"""
-    queryset = MenuItem.objects.filter(is_active=True).order_by('display_order')
+    queryset = MenuItem.objects.filter(is_active=True).select_related('category').order_by('display_order')
     serializer_class = MenuItemSerializer
     permission_classes = [AllowAny]
     
@@ -95,25 +167,94 @@ class MenuItemViewSet(viewsets.ModelViewSet):
         if self.action == 'list':
             return MenuItemListSerializer
         return MenuItemSerializer
-    
+
+    def list(self, request, *args, **kwargs):
+        """
+        メニュー一覧（店舗のメニューバージョン単位でシリアライズ結果をキャッシュ）
+
+        ?fields=で出力するフィールドを絞り込み、?layout=compactで列指向の形式
+        （カテゴリ表と項目の配列）で返す。
+        """
+        layout = request.query_params.get('layout')
+        if layout not in (None, '', 'compact'):
+            return Response(
+                {'error': 'layoutはcompactのみ指定できます'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        cache_key = menu_list_cache_key(request)
+        etag = make_etag(request, cache_key)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        data = cache.get(cache_key)
+        if data is None:
+            queryset = self.filter_queryset(self.get_queryset())
+            page = self.paginate_queryset(queryset)
+            serializer = self.get_serializer(page if page is not None else queryset, many=True)
+            rows = serializer.data
+            if layout == 'compact':
+                rows = compact_menu(rows, list(serializer.child.fields))
+            data = self.get_paginated_response(rows).data if page is not None else rows
+            cache.set(cache_key, data, menu_cache_timeout())
+        # メニューは公開情報のみのためBrotliで圧縮してよい
+        return allow_brotli(Response(data, headers={'ETag': etag}))
+
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def toggle_available(self, request, pk=None):
         """売り切れ状態を切り替え"""
         menu_item = self.get_object()
         menu_item.is_available = not menu_item.is_available
+        # post_saveシグナルでメニューキャッシュも無効化される
         menu_item.save()
         serializer = self.get_serializer(menu_item)
         return Response(serializer.data)
 
+    @action(
+        detail=True, methods=['post'], permission_classes=[IsAuthenticated],
+        parser_classes=[MultiPartParser, FormParser]
+    )
+    def upload_image(self, request, pk=None):
+        """
+        商品画像をアップロード
+
+        元画像を保存して202を返し、サムネイル・大サイズの画像（WebP・JPEG）は
+        バックグラウンドで生成する。生成後にメニュー一覧のthumbnail_urlへ反映される。
+        """
+        menu_item = self.get_object()
+        upload = request.FILES.get('image')
+        if upload is None:
+            return Response(
+                {'error': 'imageファイルが必要です'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if upload.size > settings.IMAGE_UPLOAD_MAX_BYTES:
+            return Response(
+                {'error': f'画像は{settings.IMAGE_UPLOAD_MAX_BYTES // (1024 * 1024)}MBまでです'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            with transaction.atomic():
+                image = save_original(menu_item, upload.read())
+                schedule_image_processing(menu_item.id, image.file_path)
+        except InvalidImageError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(MenuItemImageSerializer(image).data, status=status.HTTP_202_ACCEPTED)
+
 
 class SessionViewSet(viewsets.ModelViewSet):
     """セッションAPI"""
-    queryset = Session.objects.all().order_by('-started_at')
+    queryset = Session.objects.all().order_by('-started_at', '-id')
     serializer_class = SessionSerializer
+    pagination_class = SessionPagination
     permission_classes = [AllowAny]
     
     def get_queryset(self):
-        queryset = super().get_queryset()
+        # シリアライザが参照する店舗・テーブル・注文・注文明細をまとめて取得
+        queryset = super().get_queryset().select_related('store', 'table').prefetch_related(
+            Prefetch('order_set', queryset=Order.objects.prefetch_related('items').order_by('order_number'))
+        )
         session_code = self.request.query_params.get('session_code')
         table_id = self.request.query_params.get('table_id')
         active_only = self.request.query_params.get('active_only')
@@ -123,9 +264,32 @@ class SessionViewSet(viewsets.ModelViewSet):
         if table_id:
             queryset = queryset.filter(table_id=table_id)
         if active_only == 'true':
-            queryset = queryset.filter(status__in=['active', 'calling_staff', 'payment_requested'])
+            queryset = queryset.filter(status__in=Session.ACTIVE_STATUSES)
         
         return queryset
+
+    def list(self, request, *args, **kwargs):
+        """セッション一覧（session_code指定時はETagで条件付きレスポンス）"""
+        session_code = request.query_params.get('session_code')
+        if not session_code:
+            return super().list(request, *args, **kwargs)
+
+        # シリアライズ結果に影響する行の更新日時と件数を1クエリで集計してバージョンとする
+        stamp = Session.objects.filter(session_code=session_code).aggregate(
+            session_updated=Max('updated_at'),
+            table_updated=Max('table__updated_at'),
+            store_updated=Max('store__updated_at'),
+            order_updated=Max('order__updated_at'),
+            item_updated=Max('order__items__updated_at'),
+            order_count=Count('order', distinct=True),
+            item_count=Count('order__items', distinct=True),
+        )
+        etag = make_etag(request, *stamp.values())
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        return response
     
     def create(self, request, *args, **kwargs):
         serializer = SessionCreateSerializer(data=request.data)
@@ -162,7 +326,7 @@ class SessionViewSet(viewsets.ModelViewSet):
         session = self.get_object()
         session.status = 'completed'
         session.ended_at = timezone.now()
-        session.save()
+        session.save(update_fields=['status', 'ended_at', 'updated_at'])
         serializer = self.get_serializer(session)
         return Response(serializer.data)
     
@@ -170,15 +334,17 @@ class SessionViewSet(viewsets.ModelViewSet):
     def orders(self, request, pk=None):
         """セッションの全注文を取得"""
         session = self.get_object()
-        orders = session.order_set.all().order_by('order_number')
+        # get_querysetで注文番号順にプリフェッチ済み
+        orders = session.order_set.all()
         serializer = OrderSerializer(orders, many=True)
         return Response(serializer.data)
 
 
 class OrderViewSet(viewsets.ModelViewSet):
     """注文API"""
-    queryset = Order.objects.all().order_by('-ordered_at')
+    queryset = Order.objects.select_related('session__table').prefetch_related('items').order_by('-ordered_at', '-id')
     serializer_class = OrderSerializer
+    pagination_class = OrderPagination
     permission_classes = [AllowAny]
     
     def get_queryset(self):
@@ -198,13 +364,19 @@ class OrderViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         order = serializer.save()
         response_serializer = OrderSerializer(order)
+        publish_order_event(order.session.store_id, 'order.created', response_serializer.data)
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
     
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    @transaction.atomic
     def update_status(self, request, pk=None):
         """注文ステータスを更新"""
         order = self.get_object()
         new_status = request.data.get('status')
+        # 同時に更新されても集計列を二重に加減算しないよう行ロックして現在値を取得
+        previous_status = Order.objects.select_for_update().values_list(
+            'status', flat=True
+        ).get(pk=order.pk)
         
         if new_status not in dict(Order.STATUS_CHOICES).keys():
             return Response(
@@ -227,23 +399,80 @@ class OrderViewSet(viewsets.ModelViewSet):
                 order.cancelled_by = request.user
         
         order.save()
+        order.update_session_totals(previous_status)
+        rollup_order_status(order, previous_status)
         
         # 注文明細のステータスも更新
         order.items.update(status=new_status)
         
+        publish_order_event(order.session.store_id, 'order.status', order_status_delta(order))
+        enqueue_notification(order.session.telegram_chat_id, order_status_message(order))
+        
         serializer = self.get_serializer(order)
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def dashboard(self, request):
-        """調理ダッシュボード用データ"""
-        # 未完了の注文を取得
-        orders = Order.objects.filter(
-            status__in=['pending', 'cooking', 'ready']
-        ).select_related('session', 'session__table').prefetch_related('items').order_by('ordered_at')
+        """
+        調理ダッシュボード用データ
+        
+        store_id省略時はログインユーザーの店舗を対象とする。
+        sinceに前回レスポンスのcursorを指定すると、それ以降に更新された注文
+        （提供済み・キャンセルを含む）のみを返すため、差分だけを取得できる。
+        """
+        store_id = str(request.query_params.get('store_id') or getattr(request.user, 'store_id', None) or '')
+        if not store_id.isdigit():
+            return Response(
+                {'error': 'store_idパラメータが不正です'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not can_access_store(request.user, store_id):
+            return Response(
+                {'error': 'この店舗の注文は参照できません'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        since = request.query_params.get('since')
+        try:
+            limit = min(int(request.query_params.get('limit', DASHBOARD_PAGE_SIZE)), DASHBOARD_MAX_PAGE_SIZE)
+            if limit < 1:
+                raise ValueError(limit)
+            since_cursor = parse_dashboard_cursor(since) if since else None
+        except ValueError:
+            return Response(
+                {'error': 'sinceまたはlimitパラメータが不正です'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        orders = dashboard_queryset(store_id)
+        if since_cursor:
+            updated_at, order_id = since_cursor
+            orders = orders.filter(
+                Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=order_id)
+            )
+        else:
+            # 初回は未完了の注文のみ
+            orders = orders.filter(status__in=Order.OPEN_STATUSES)
+        
+        orders = list(orders.order_by('updated_at', 'id')[:limit + 1])
+        has_more = len(orders) > limit
+        orders = orders[:limit]
+        
+        if orders and (since_cursor or has_more):
+            cursor = encode_dashboard_cursor(orders[-1])
+        elif not since_cursor:
+            # 初回取得を全件返した場合は、対象外の完了済み注文も含めた最新更新位置から差分を取る
+            latest = Order.objects.filter(
+                session__store_id=store_id
+            ).only('id', 'updated_at').order_by('-updated_at', '-id').first()
+            cursor = encode_dashboard_cursor(latest) if latest else None
+        else:
+            cursor = since
+        
+        return Response({
+            'results': OrderSerializer(orders, many=True).data,
+            'cursor': cursor,
+            'has_more': has_more,
+        })
 
 
 class OrderItemViewSet(viewsets.ModelViewSet):
@@ -253,6 +482,7 @@ class OrderItemViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     @action(detail=True, methods=['post'])
+    @transaction.atomic
     def update_status(self, request, pk=None):
         """注文明細のステータスを更新"""
         order_item = self.get_object()
@@ -267,14 +497,27 @@ class OrderItemViewSet(viewsets.ModelViewSet):
         order_item.status = new_status
         order_item.save()
         
-        # 全ての明細が同じステータスになったら注文のステータスも更新
         order = order_item.order
+        store_id = order.session.store_id
+        publish_order_event(store_id, 'order_item.status', {
+            'id': order_item.id,
+            'order': order.id,
+            'status': order_item.status,
+        })
+        
+        # 全ての明細が同じステータスになったら注文のステータスも更新
         all_items_same_status = all(
             item.status == new_status 
             for item in order.items.all()
         )
         
-        if all_items_same_status and order.status != new_status:
+        if not all_items_same_status or order.status == new_status:
+            # ダッシュボードの差分取得で拾えるよう注文の更新日時を進める
+            order.save(update_fields=['updated_at'])
+        else:
+            previous_status = Order.objects.select_for_update().values_list(
+                'status', flat=True
+            ).get(pk=order.pk)
             order.status = new_status
             
             if new_status == 'cooking' and not order.cooking_started_at:
@@ -285,6 +528,10 @@ class OrderItemViewSet(viewsets.ModelViewSet):
                 order.served_at = timezone.now()
             
             order.save()
+            order.update_session_totals(previous_status)
+            rollup_order_status(order, previous_status)
+            publish_order_event(store_id, 'order.status', order_status_delta(order))
+            enqueue_notification(order.session.telegram_chat_id, order_status_message(order))
         
         serializer = self.get_serializer(order_item)
         return Response(serializer.data)
@@ -292,8 +539,9 @@ class OrderItemViewSet(viewsets.ModelViewSet):
 
 class StaffCallViewSet(viewsets.ModelViewSet):
     """店員呼び出しAPI"""
-    queryset = StaffCall.objects.all().order_by('-called_at')
+    queryset = StaffCall.objects.all().order_by('-called_at', '-id')
     serializer_class = StaffCallSerializer
+    pagination_class = StaffCallPagination
     permission_classes = [AllowAny]
     
     def get_queryset(self):
@@ -326,7 +574,7 @@ class StaffCallViewSet(viewsets.ModelViewSet):
         # セッションのステータスを戻す
         if staff_call.session.status == 'calling_staff':
             staff_call.session.status = 'active'
-            staff_call.session.save()
+            staff_call.session.save(update_fields=['status', 'updated_at'])
         
         serializer = self.get_serializer(staff_call)
         return Response(serializer.data)
@@ -344,8 +592,9 @@ class StaffCallViewSet(viewsets.ModelViewSet):
 
 class PaymentViewSet(viewsets.ModelViewSet):
     """会計API"""
-    queryset = Payment.objects.all().order_by('-requested_at')
+    queryset = Payment.objects.all().order_by('-requested_at', '-id')
     serializer_class = PaymentSerializer
+    pagination_class = PaymentPagination
     permission_classes = [AllowAny]
     
     def get_queryset(self):
@@ -368,6 +617,7 @@ class PaymentViewSet(viewsets.ModelViewSet):
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
     
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    @transaction.atomic
     def complete(self, request, pk=None):
         """会計を完了"""
         payment = self.get_object()
@@ -379,27 +629,76 @@ class PaymentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        # 二重に完了しても売上集計に重複計上しないよう行ロックして現在値を取得
+        previous_status = Payment.objects.select_for_update().values_list(
+            'status', flat=True
+        ).get(pk=payment.pk)
+        
         payment.payment_method = payment_method
         payment.status = 'paid'
-        payment.paid_at = timezone.now()
+        if previous_status != 'paid':
+            payment.paid_at = timezone.now()
         payment.save()
+        rollup_payment_status(payment, previous_status)
         
         # セッションを完了
         payment.session.status = 'completed'
         payment.session.ended_at = timezone.now()
-        payment.session.save()
+        payment.session.save(update_fields=['status', 'ended_at', 'updated_at'])
         
         serializer = self.get_serializer(payment)
         return Response(serializer.data)
 
 
+class ReportViewSet(viewsets.ViewSet):
+    """レポートAPI"""
+    permission_classes = [IsAuthenticated]
+    
+    @action(detail=False, methods=['get'])
+    def sales(self, request):
+        """
+        売上レポート
+        
+        date_from〜date_to（YYYY-MM-DD、両端を含む。省略時は当日）の売上を
+        時間帯別の集計行から返す。store_id省略時はログインユーザーの店舗を対象とする。
+        """
+        store_id = request.query_params.get('store_id') or getattr(request.user, 'store_id', None)
+        group_by = request.query_params.get('group_by', 'day')
+        today = timezone.localdate()
+        try:
+            date_from = datetime.date.fromisoformat(request.query_params.get('date_from', today.isoformat()))
+            date_to = datetime.date.fromisoformat(request.query_params.get('date_to', date_from.isoformat()))
+            limit = min(int(request.query_params.get('limit', 10)), 100)
+            store_id = int(store_id)
+            if limit < 1:
+                raise ValueError(limit)
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'store_id・date_from・date_to・limitパラメータが不正です'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if group_by not in ('day', 'hour') or date_from > date_to:
+            return Response(
+                {'error': 'group_byはdayまたはhour、期間はdate_from≦date_toで指定してください'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not can_access_store(request.user, store_id):
+            return Response(
+                {'error': 'この店舗の売上は参照できません'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        return Response(sales_report(store_id, date_from, date_to, group_by, limit))
+
+
 # Telegram Bot関連ビュー
 from rest_framework.views import APIView
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
+from django.core.serializers.json import DjangoJSONEncoder
 import json
 import asyncio
-from .telegram_bot import telegram_bot
+from .telegram_bot import update_queue
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -408,22 +707,241 @@ class TelegramWebhookView(APIView):
     permission_classes = [AllowAny]
     
     def post(self, request):
-        """Webhookからのアップデートを受信"""
+        """Webhookからのアップデートを受信（処理はキューに投入して即座に応答）"""
+        if not update_queue.submit(request.data):
+            # Telegramは2xx以外を受け取ると後で再送する
+            return Response(
+                {'error': '処理待ちのアップデートが多すぎます'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        
+        return Response({'status': 'ok'})
+
+
+# キッチンダッシュボード配信（ASGIで動作させること）
+from django.http import JsonResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
+
+# 接続維持のためのコメント送信間隔（秒）
+DASHBOARD_STREAM_HEARTBEAT = 15
+
+
+def dashboard_snapshot(store_id):
+    """店舗の未完了注文一覧"""
+    orders = dashboard_queryset(store_id).filter(
+        status__in=Order.OPEN_STATUSES
+    ).order_by('ordered_at')
+    return OrderSerializer(orders, many=True).data
+
+
+def _sse(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)}\n\n"
+
+
+async def dashboard_stream(request):
+    """
+    調理ダッシュボード用のServer-Sent Eventsストリーム
+
+    接続時に未完了注文のスナップショットを送り、以降は注文作成・
+    ステータス更新の差分のみを送信する。
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'error': '認証が必要です'}, status=status.HTTP_403_FORBIDDEN)
+    
+    store_id = request.GET.get('store_id')
+    if not store_id or not store_id.isdigit():
+        return JsonResponse({'error': 'store_idパラメータが必要です'}, status=status.HTTP_400_BAD_REQUEST)
+    if not can_access_store(user, store_id):
+        return JsonResponse({'error': 'この店舗の注文は参照できません'}, status=status.HTTP_403_FORBIDDEN)
+    
+    async def stream():
+        # スナップショット取得中のイベントを取りこぼさないよう先に購読する
+        queue = dashboard_events.subscribe(store_id)
         try:
-            update_data = request.data
-            
-            # 非同期処理を実行
-            asyncio.run(telegram_bot.process_update(update_data))
-            
-            return Response({'status': 'ok'})
-        except Exception as e:
+            yield _sse('snapshot', await sync_to_async(dashboard_snapshot)(store_id))
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), DASHBOARD_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                
+                if event['type'] == RESYNC:
+                    yield _sse('snapshot', await sync_to_async(dashboard_snapshot)(store_id))
+                else:
+                    yield _sse(event['type'], event['data'])
+        finally:
+            dashboard_events.unsubscribe(store_id, queue)
+    
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# CSV/NDJSONエクスポート
+from django.core.handlers.asgi import ASGIRequest
+from .exports import EXPORTS, EXPORT_FORMATS, iter_export, iter_batches, next_batch
+
+
+class ExportView(APIView):
+    """
+    注文・注文明細・会計のエクスポート
+    
+    kindはorders・order-items・payments。export_format（csvまたはndjson）、
+    store_id、date_from・date_to（YYYY-MM-DD、両端を含む）で絞り込む。
+    管理者以外はログインユーザーの店舗のみ出力する。
+    DRFの?format=はレンダラー選択に使われるため、出力形式はexport_formatで指定する。
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def perform_content_negotiation(self, request, force=False):
+        # ストリームはレンダラーを通さないため、Acceptヘッダーが何であっても406にしない
+        return super().perform_content_negotiation(request, force=True)
+    
+    def get(self, request, kind):
+        export_format = request.query_params.get('export_format', 'csv')
+        if kind not in EXPORTS or export_format not in EXPORT_FORMATS:
+            return Response(
+                {'error': f'kindは{"・".join(EXPORTS)}、export_formatは{"・".join(EXPORT_FORMATS)}のいずれかです'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        parsers = {
+            'store_id': int,
+            'date_from': datetime.date.fromisoformat,
+            'date_to': datetime.date.fromisoformat,
+        }
+        try:
+            filters = {
+                name: parse(request.query_params[name]) if request.query_params.get(name) else None
+                for name, parse in parsers.items()
+            }
+        except ValueError:
             return Response(
-                {'error': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {'error': 'store_id・date_from・date_toパラメータが不正です'},
+                status=status.HTTP_400_BAD_REQUEST
             )
+        if not can_access_store(request.user, filters['store_id'] or ''):
+            if filters['store_id']:
+                return Response(
+                    {'error': 'この店舗のデータは出力できません'},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+            filters['store_id'] = request.user.store_id
+        
+        lines = iter_export(kind, export_format, **filters)
+        if isinstance(request._request, ASGIRequest):
+            # ASGIでは同期イテレータが全件バッファリングされるため、非同期に少しずつ読み出す
+            async def content():
+                while batch := await sync_to_async(next_batch)(lines):
+                    yield batch
+            streaming_content = content()
+        else:
+            streaming_content = iter_batches(lines)
+        
+        response = StreamingHttpResponse(streaming_content, content_type=EXPORT_FORMATS[export_format])
+        filename = f'{kind}_{timezone.localtime():%Y%m%d%H%M%S}.{export_format}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+# Mini App起動データ
+def miniapp_menu(store_id):
+    """店舗情報・カテゴリ・メニュー（メニューバージョン単位でキャッシュ）"""
+    cache_key = store_menu_cache_key(store_id, 'miniapp_menu')
+    data = cache.get(cache_key)
+    if data is None:
+        store = Store.objects.only('id', 'name').get(pk=store_id)
+        items = MenuItem.objects.filter(
+            store_id=store_id, is_active=True
+        ).select_related('category').order_by('display_order')
+        data = {
+            'store': {'id': store.id, 'name': store.name},
+            'categories': list(
+                Category.objects.filter(store_id=store_id, is_active=True)
+                .order_by('display_order')
+                .values('id', 'name', 'display_order')
+            ),
+            'menu': MenuItemListSerializer(items, many=True).data,
+        }
+        cache.set(cache_key, data, menu_cache_timeout())
+    return data
+
+
+class MiniAppBootstrapView(APIView):
+    """
+    Mini Appの起動データ
+
+    GET ?table=<QRコードのトークンまたはURL>で、テーブル・店舗・来店中のセッション・
+    カテゴリ・メニューを1回のレスポンスで返す（セッションがなければsessionはnull）。
+    POSTでtable・party_sizeを送るとセッションを作成（既存があれば接続）して同じ内容を返す。
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        entry = table_index.get(request.query_params.get('table', ''))
+        if entry is None or not entry.is_available:
+            return Response(
+                {'error': 'テーブルが見つかりません'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        session = Session.objects.filter(
+            table_id=entry.table_id,
+            status__in=Session.ACTIVE_STATUSES
+        ).order_by('-started_at', '-id').first()
+        return Response(self.payload(entry.to_table(), session))
+
+    def post(self, request):
+        serializer = SessionCreateSerializer(data={
+            'qr_code_url': request.data.get('table', ''),
+            'party_size': request.data.get('party_size'),
+            'telegram_chat_id': request.data.get('telegram_chat_id') or '',
+        })
+        serializer.is_valid(raise_exception=True)
+        session = serializer.validated_data.get('existing_session')
+        is_new = session is None
+        if is_new:
+            session = serializer.save()
+        return Response(
+            self.payload(serializer.validated_data['table'], session),
+            status=status.HTTP_201_CREATED if is_new else status.HTTP_200_OK
+        )
+
+    @staticmethod
+    def payload(table, session):
+        menu = miniapp_menu(table.store_id)
+        return {
+            'table': {'id': table.id, 'table_number': table.table_number, 'capacity': table.capacity},
+            'store': menu['store'],
+            'session': MiniAppSessionSerializer(session).data if session else None,
+            'categories': menu['categories'],
+            'menu': menu['menu'],
+        }
 
 
 from django.shortcuts import render
+from django.views.static import serve
+from .images import is_content_addressed
+
+# 内容のハッシュをファイル名とするメディアのキャッシュ期間（1年）
+IMMUTABLE_MEDIA_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def serve_media(request, path):
+    """
+    メディアファイルを配信
+
+    内容のハッシュをファイル名とするメニュー画像は内容が変わればURLも変わるため、
+    再検証なしで無期限にキャッシュさせる。それ以外（QRコード等）は毎回再検証させる。
+    """
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if is_content_addressed(path):
+        response['Cache-Control'] = f'public, max-age={IMMUTABLE_MEDIA_MAX_AGE}, immutable'
+    else:
+        response['Cache-Control'] = 'no-cache'
+    return response
 
 
 def miniapp_view(request):
@@ -439,7 +957,7 @@ def miniapp_view(request):
         
         # セッションステータスを戻す
         payment.session.status = 'active'
-        payment.session.save()
+        payment.session.save(update_fields=['status', 'updated_at'])
         
         serializer = self.get_serializer(payment)
         return Response(serializer.data)